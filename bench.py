@@ -0,0 +1,12 @@
+import os
+
+# The benchmark never needs a real screen, so this must be set before pygame
+# is initialised by importing the meter.
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+
+if __name__ == '__main__':
+    # Worker processes re-run this script as they start, so the meter (and so
+    # pygame) is only imported when running the benchmark itself
+    import meter.bench
+    meter.bench.main()
@@ -1,5 +1,18 @@
-from .meter import Meter
+import time
+
+# Start-up is timed from when the package is first imported
+STARTED = time.perf_counter()
 
 
 def start():
+    from .meter import Meter
     Meter().main()
+
+
+def __getattr__(name):
+    # Importing `.meter` initialises pygame, so it is only done when needed.
+    # This lets tools such as `meter.offline` run without a display.
+    if name == 'Meter':
+        from .meter import Meter
+        return Meter
+    raise AttributeError(name)
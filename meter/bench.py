@@ -0,0 +1,140 @@
+"""
+A headless benchmark of the full meter pipeline.
+
+Synthetic audio is fed through `Meter` in place of PyAudio and the interface
+is drawn using SDL's dummy video driver. This module must be imported after
+`SDL_VIDEODRIVER` has been set, so use the `bench.py` script to run it.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from . import meter
+from .sources import SOURCES, WavSource
+
+
+class BenchMeter(meter.Meter):
+    """
+    A meter which notes when the newest level it has produced was captured.
+    Only levels captured since `since` are counted.
+    """
+
+    def __init__(self, sources):
+        self.levels = 0
+        self.captured = None
+        self.since = 0
+        super().__init__(sources)
+
+    def add_value(self, val, index, captured=None, avg=None, peaks=None):
+        # Input 0 gets exactly one value per hop of the first stream, in
+        # both the thread and process backends.
+        if index == 0 and captured >= self.since:
+            self.captured = captured
+            self.levels += 1
+        super().add_value(val, index, captured, avg, peaks)
+
+
+def run(source, size, seconds, modes, backend='thread', workers=1, hop=0, window=0):
+    """Run the meter for a while and return the measured statistics"""
+    meter.CONFIG.override(screen_width=size[0], screen_height=size[1], rate=source.rate, chunk=source.chunk,
+                          channels=source.channels, line_in=False, dsp_backend=backend, dsp_workers=workers,
+                          hop=hop, window=window)
+
+    bench = BenchMeter([source])
+    root = bench.root
+
+    # Dismiss any message boxes as they force a full re-draw every frame
+    while root.children > 1:
+        root.remove_child(root._children[-1])
+    for button in modes:
+        bench.buttons[button].state = True
+        if bench.buttons[button].callback is not None:
+            bench.buttons[button].callback(None, True)
+
+    # Don't count the time taken to start any worker processes, or the audio
+    # which built up meanwhile (such as while SciPy loads) and is still to be
+    # worked through
+    while not bench.levels:
+        root.step()
+    start = bench.since = time.perf_counter()
+    bench.levels = 0
+    bench.captured = None
+
+    frames = 0
+    latencies = []
+    last = None
+
+    while time.perf_counter() - start < seconds:
+        if not root.step():
+            continue
+        frames += 1
+
+        # Only count frames which show a level that wasn't shown before
+        captured = bench.captured
+        if captured is not None and captured != last:
+            latencies.append(time.perf_counter() - captured)
+            last = captured
+    elapsed = time.perf_counter() - start
+    root.running = False
+    bench.close()
+
+    latencies = np.array(latencies or [np.nan]) * 1000
+    return {
+        'levels': bench.levels / elapsed,
+        'realtime': bench.levels * bench.hop / source.rate / elapsed,
+        'fps': frames / elapsed,
+        'p50': np.percentile(latencies, 50),
+        'p95': np.percentile(latencies, 95),
+        'p99': np.percentile(latencies, 99),
+    }
+
+
+def parse_size(size):
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the meter without a sound card or screen.')
+    parser.add_argument('--source', choices=sorted(SOURCES) + ['wav'], default='pink',
+                        help='the synthetic audio to feed in')
+    parser.add_argument('--wav', help='the file to play when using the wav source')
+    parser.add_argument('--chunk', type=int, nargs='+', default=[256, 1024, 4096],
+                        help='the chunk sizes to test')
+    parser.add_argument('--hop', type=int, default=0, help='the frames between levels [the chunk]')
+    parser.add_argument('--window', type=int, default=0, help='the frames each level is measured over [the hop]')
+    parser.add_argument('--size', type=parse_size, nargs='+', default=[(320, 240)],
+                        help='the resolutions to test, such as 320x240')
+    parser.add_argument('--channels', type=int, default=1,
+                        help='the number of channels to generate (WAV files use their own)')
+    parser.add_argument('--seconds', type=float, default=5, help='how long to run each test for')
+    parser.add_argument('--flat-out', action='store_true',
+                        help='produce audio as fast as it is consumed rather than in real time')
+    parser.add_argument('--backend', choices=['thread', 'process'], default='thread',
+                        help='where to run the DSP')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='the number of worker processes for the process backend')
+    parser.add_argument('--aw', action='store_true', help='enable A-weighting')
+    parser.add_argument('--split', action='store_true', help='enable split mode')
+    parser.add_argument('--graph', action='store_true', help='show the graph')
+    args = parser.parse_args(argv)
+
+    if args.source == 'wav' and not args.wav:
+        parser.error('--wav is required for the wav source')
+
+    modes = [button for enabled, button in ((args.aw, meter.AW_BTN), (args.split, meter.SPLIT_BTN),
+                                            (args.graph, meter.GRAPH_BTN)) if enabled]
+
+    print('chunk  size       levels/s  x realtime    fps   p50 ms   p95 ms   p99 ms')
+    for size in args.size:
+        for chunk in args.chunk:
+            if args.source == 'wav':
+                source = WavSource(chunk, args.wav, realtime=not args.flat_out)
+            else:
+                source = SOURCES[args.source](chunk, meter.CONFIG.rate,
+                                              realtime=not args.flat_out, channels=args.channels)
+
+            stats = run(source, size, args.seconds, modes, args.backend, args.workers, args.hop, args.window)
+            print('{:5d}  {:<9}  {levels:8.1f}  {realtime:10.2f}  {fps:5.1f}  {p50:7.1f}  {p95:7.1f}  {p99:7.1f}'
+                  .format(chunk, '%dx%d' % size, **stats))
@@ -0,0 +1,134 @@
+import collections
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    A fixed-size FIFO of samples backed by a preallocated NumPy array.
+
+    It is designed for exactly one producer and one consumer. The producer
+    only ever advances the write counter and the consumer only ever advances
+    the read counter, so neither side needs to take a lock. Samples that
+    arrive while the buffer is full are dropped and counted in `.dropped`.
+    """
+
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.dropped = 0
+
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._written = 0
+        self._read = 0
+
+    @property
+    def available(self):
+        """The number of samples waiting to be read."""
+        return self._written - self._read
+
+    def write(self, samples):
+        """Copy samples into the buffer. Only call this from the producer."""
+        count = len(samples)
+        free = self.capacity - self.available
+        if count > free:
+            self.dropped += count - free
+            count = free
+
+        start = self._written % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:count - first] = samples[first:count]
+
+        # Publish the samples only once they have been fully copied
+        self._written += count
+
+    def read(self, count):
+        """Remove and return up to `count` samples. Only call this from the consumer."""
+        count = min(count, self.available)
+
+        start = self._read % self.capacity
+        first = min(count, self.capacity - start)
+        out = np.empty(count, dtype=self._data.dtype)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:count - first]
+
+        self._read += count
+        return out
+
+
+class History:
+    """
+    A fixed-length history of values stored in a circular, array-backed
+    buffer. Appending never moves the existing values, so it takes the same
+    time no matter how long the history is.
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self.count = 0  # The total number of values ever appended
+
+        self._data = np.zeros(length)
+
+    def __len__(self):
+        return min(self.count, self.length)
+
+    def append(self, value):
+        self._data[self.count % self.length] = value
+        self.count += 1
+
+    def extend(self, values):
+        """Append several values at once. Only the newest `length` are kept."""
+        count = len(values)
+        values = values[max(count - self.length, 0):]
+
+        start = (self.count + count - len(values)) % self.length
+        first = min(len(values), self.length - start)
+        self._data[start:start + first] = values[:first]
+        self._data[:len(values) - first] = values[first:]
+        self.count += count
+
+    def tail(self, count):
+        """Return the newest `count` stored values as a new array, oldest first."""
+        count = min(count, len(self))
+        end = self.count % self.length
+        if count <= end:
+            return self._data[end - count:end].copy()
+        return np.concatenate((self._data[end - count:], self._data[:end]))
+
+    def values(self):
+        """Return the stored values as a new array, oldest first."""
+        if self.count <= self.length:
+            return self._data[:self.count].copy()
+
+        start = self.count % self.length
+        return np.concatenate((self._data[start:], self._data[:start]))
+
+
+class SlidingWindow:
+    """
+    Tracks the minimum of the last `size` values pushed to it.
+
+    A monotonic deque is kept of the values which could still become the
+    minimum, so each push is amortised constant time rather than scanning
+    the whole window.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+        self._count = 0
+        self._window = collections.deque()
+
+    def push(self, value):
+        """Add a value to the window and return the new minimum"""
+        window = self._window
+        while window and window[-1][1] >= value:
+            window.pop()
+        window.append((self._count, value))
+        self._count += 1
+
+        # Forget the minimum once it has slid out of the window
+        if window[0][0] <= self._count - self.size - 1:
+            window.popleft()
+
+        return window[0][1]
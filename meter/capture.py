@@ -0,0 +1,101 @@
+import collections
+import time
+
+import pyaudio
+
+from .buffers import RingBuffer
+from . import dsp
+
+
+class BlockingCapture:
+    """
+    Reads chunks straight from a PyAudio stream on the calling thread. Any
+    processing done between reads delays the next one, so slow DSP will show
+    up as overflows which PyAudio then silently discards.
+
+    Both capture classes append the time each chunk was captured to `.stamps`,
+    which the consumer should pop as it handles each chunk.
+    """
+
+    def __init__(self, audio, device, chunk, **kwargs):
+        self.chunk = chunk
+        self.xruns = 0
+        self.stamps = collections.deque()
+        self.stream = audio.open(input=True, frames_per_buffer=chunk, input_device_index=device, **kwargs)
+
+    @property
+    def dropped(self):
+        """Blocking reads cannot tell how much audio was lost."""
+        return 0
+
+    def read(self):
+        """Block for and return a list containing a single chunk"""
+        data = dsp.as_samples(self.stream.read(self.chunk, exception_on_overflow=False))
+        self.stamps.append(time.perf_counter())
+        return [data]
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+
+
+class CallbackCapture:
+    """
+    Captures audio using PyAudio's non-blocking callback. The callback does
+    nothing but copy the incoming buffer into a preallocated `RingBuffer`, so
+    capture is never held up by processing. The consumer then drains every
+    complete chunk that has built up in one go.
+    """
+
+    def __init__(self, audio, device, chunk, buffer_chunks=16, **kwargs):
+        self.chunk = chunk
+        self.xruns = 0
+        self.stamps = collections.deque()
+
+        self._samples = chunk * kwargs.get('channels', 1)
+        self._ring = RingBuffer(self._samples * buffer_chunks)
+        # Check back roughly four times per chunk when waiting for audio
+        self._poll = chunk / kwargs.get('rate', 44100) / 4
+
+        self.stream = audio.open(input=True, frames_per_buffer=chunk, input_device_index=device,
+                                 stream_callback=self._callback, **kwargs)
+
+    @property
+    def dropped(self):
+        """The number of samples lost because the consumer fell behind."""
+        return self._ring.dropped
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Runs on PortAudio's thread, so it must do as little as possible"""
+        if status & pyaudio.paInputOverflow:
+            self.xruns += 1
+
+        # The stamp goes first, as the consumer can read the chunk as soon as
+        # it is written. PortAudio delivers a chunk per call, and one that
+        # didn't fit has no samples to stamp.
+        self.stamps.append(time.perf_counter())
+        dropped = self._ring.dropped
+        self._ring.write(dsp.as_samples(in_data))
+        if self._ring.dropped != dropped:
+            self.stamps.pop()
+        return None, pyaudio.paContinue
+
+    def read(self):
+        """
+        Return every complete chunk that is waiting. An empty list is returned
+        if nothing arrived after a short wait, so callers can check whether
+        they should stop.
+        """
+        if self._ring.available < self._samples:
+            time.sleep(self._poll)
+
+        count = self._ring.available // self._samples
+        if not count:
+            return []
+
+        block = self._ring.read(count * self._samples)
+        return [block[i * self._samples:(i + 1) * self._samples] for i in range(count)]
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
@@ -1,4 +1,5 @@
 import os
+import time
 
 import ruamel.yaml as yaml
 
@@ -6,27 +7,145 @@ CONFIG_PATH = 'meter/config/config.yml'
 DEFAULT_CONFIG = 'meter/config/.default_config.yml'
 
 
-def load_config():
-    """Load the config or create it if it doesn't exist."""
-    new = False
-    if not os.path.exists(CONFIG_PATH):
-        with open(DEFAULT_CONFIG) as file1:
-            with open(CONFIG_PATH, 'w') as file2:
-                file2.write(file1.read())
-        new = True
+# The smallest values which work, for the numbers where less would fail
+MINIMUMS = {
+    'fps': 1, 'rate': 1, 'chunk': 1, 'buffer_chunks': 1, 'channels': 1, 'dsp_workers': 1,
+    'hop': 0, 'window': 0, 'average_samples': 1, 'leq_window': 1, 'graph_samples': 2,
+    'peak_hold': 0, 'band_fft_size': 2, 'big_font_size': 1, 'mid_font_size': 1, 'font_size': 1,
+}
 
-    with open(DEFAULT_CONFIG) as file_:
-        default_config = yaml.safe_load(file_)
-    with open(CONFIG_PATH) as file_:
-        config = yaml.safe_load(file_)
 
-    # Restore omitted values from config
-    for key in default_config:
-        if key not in config:
-            config[key] = default_config[key]
+def _freeze(value):
+    """Turn lists (such as colours) into tuples so they can't be changed in place"""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
 
-    return config, new
 
+def _check(key, value, default):
+    """
+    Check a value against the type of its default, returning it in the form
+    it should be used in. A `ValueError` is raised if it doesn't fit.
+    """
+    def fail(kind):
+        return ValueError('%s should be %s, not %r' % (key, kind, value))
 
-if __name__ == '__main__':
-    load_config()
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise fail('True or False')
+    elif isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise fail('a number')
+        if key in MINIMUMS and value < MINIMUMS[key]:
+            raise fail('at least %s' % MINIMUMS[key])
+        if isinstance(default, float):
+            value = float(value)
+    elif isinstance(default, str):
+        # Text such as the welcome message can be turned off entirely
+        if value is None or value is False:
+            value = ''
+        elif not isinstance(value, str):
+            raise fail('text')
+    elif isinstance(default, list):
+        if not isinstance(value, list):
+            raise fail('a list')
+    return _freeze(value)
+
+
+class Config:
+    """
+    The settings from `config.yml`, with anything it leaves out taken from
+    the defaults. Settings are read as attributes, such as `CONFIG.fps`, and
+    are checked against the type of their default, and any minimum in
+    `MINIMUMS`, when they are loaded.
+
+    The rest of the meter can't change the settings. `reload` swaps a whole
+    new set in at once, so nothing ever sees a mix of the old and new file.
+    `poll` reloads the file when it has been modified, and anything which
+    keeps a copy of a setting can `watch` for that to happen.
+    """
+    __slots__ = ('__dict__', 'created', '_path', '_defaults', '_mtime', '_checked', '_overrides', '_watchers')
+
+    def __init__(self, path=CONFIG_PATH, defaults=DEFAULT_CONFIG):
+        set_ = object.__setattr__
+        set_(self, '_path', path)
+        set_(self, '_defaults', defaults)
+        set_(self, '_checked', time.monotonic())
+        set_(self, '_overrides', {})
+        set_(self, '_watchers', [])
+
+        # Start from a copy of the defaults if there is no config
+        set_(self, 'created', not os.path.exists(path))
+        if self.created:
+            with open(defaults) as file1:
+                with open(path, 'w') as file2:
+                    file2.write(file1.read())
+
+        set_(self, '_mtime', os.path.getmtime(path))
+        set_(self, '__dict__', self._load())
+
+    def _load(self):
+        """Read, merge and check both files, returning the settings"""
+        with open(self._defaults) as file_:
+            defaults = yaml.safe_load(file_)
+        with open(self._path) as file_:
+            config = yaml.safe_load(file_) or {}
+
+        settings = {}
+        for key, value in dict(config, **self._overrides).items():
+            settings[key] = _check(key, value, defaults[key]) if key in defaults else _freeze(value)
+
+        # Restore omitted values from the defaults
+        for key, value in defaults.items():
+            if key not in settings:
+                settings[key] = _freeze(value)
+        return settings
+
+    def __setattr__(self, key, value):
+        raise AttributeError('The config is read-only, so use override() to change %s' % key)
+
+    def override(self, **settings):
+        """Replace settings for this run only, such as for the benchmark."""
+        self._overrides.update(settings)
+        object.__setattr__(self, '__dict__', self._load())
+
+    def watch(self, callback):
+        """Call `callback` with no arguments whenever the config is reloaded."""
+        self._watchers.append(callback)
+
+    def reload(self):
+        """
+        Load the config again. If the file has a mistake in it, this is
+        reported and the current settings are kept. Returns whether the new
+        settings were loaded.
+        """
+        try:
+            settings = self._load()
+        except (ValueError, yaml.YAMLError) as error:
+            print('Not reloading the config: %s' % error)
+            return False
+
+        object.__setattr__(self, '__dict__', settings)
+        for callback in self._watchers:
+            callback()
+        return True
+
+    def poll(self, interval=1):
+        """Reload the config if the file has been modified, checking at most every `interval` seconds."""
+        now = time.monotonic()
+        if now - self._checked < interval:
+            return False
+        object.__setattr__(self, '_checked', now)
+
+        try:
+            mtime = os.path.getmtime(self._path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        object.__setattr__(self, '_mtime', mtime)
+        return self.reload()
+
+
+CONFIG = Config()
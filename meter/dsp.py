@@ -0,0 +1,609 @@
+import functools
+import math
+import os
+
+import numpy as np
+
+FULL_SCALE = 32768  # The magnitude of a full-scale int16 sample
+FLOOR = 48          # The quietest level (in -dB) that the meter can show
+
+# Designed filters are kept here so later starts don't need to design them
+FILTER_CACHE = os.path.join(os.path.dirname(__file__), 'config', 'filters')
+
+
+def _signal():
+    """
+    Import `scipy.signal` the first time it is needed. It takes most of a
+    second to import, which would otherwise be most of the meter's start-up.
+    """
+    import scipy.signal
+    return scipy.signal
+
+
+def as_samples(data):
+    """View a raw PyAudio buffer as int16 samples without copying it"""
+    return np.frombuffer(data, dtype=np.int16)
+
+
+def _as_float(samples):
+    """
+    Integer samples are widened to float32 before squaring as the products
+    would otherwise overflow. Filtered data is already floating point and is
+    used as-is.
+    """
+    if samples.dtype.kind == 'f':
+        return samples
+    return samples.astype(np.float32)
+
+
+def deinterleave(samples, channels):
+    """View interleaved samples as a `(frames, channels)` array without copying"""
+    return samples.reshape(-1, channels)
+
+
+def to_db_array(levels):
+    """Convert an array of 0-1 levels to the -dB values shown by the meter"""
+    with np.errstate(divide='ignore'):
+        return np.clip(np.abs(20 * np.log10(levels)), 0, FLOOR)
+
+
+def power_to_db(power):
+    """Convert mean squares, such as band powers, to the -dB shown by the meter"""
+    return to_db_array(np.sqrt(power))
+
+
+def peak_to_db(peaks):
+    """
+    Convert peaks to the -dB shown by the meter. Unlike levels, true peaks
+    can be over full scale, and those are shown as 0.
+    """
+    # Clamping the peaks first keeps the quietest at FLOOR
+    return np.maximum(-20 * np.log10(np.maximum(peaks, 10 ** (-FLOOR / 20))), 0)
+
+
+# Hopping
+class Hopper:
+    """
+    Re-cuts a stream of blocks of any size into a level every `hop` frames,
+    each measured over the last `window` frames, so how often the meter
+    updates and what it measures over don't depend on the capture chunk.
+    The window defaults to the hop, and can be longer so the windows overlap.
+
+    The last `max(window, hop)` frames are kept for each key. Every window
+    ending within a block is measured at once, from a strided view over the
+    kept frames followed by the block.
+    """
+
+    def __init__(self, hop, window=None):
+        self.hop = hop
+        self.window = window or hop
+        self.keep = max(self.window, hop)
+
+        self._history = {}
+        self._phase = {}  # The frames since the last hop ended, for each key
+
+    def reset(self, key=None):
+        """Forget the frames kept for a key, or for every key."""
+        if key is None:
+            self._history, self._phase = {}, {}
+        else:
+            self._history.pop(key, None)
+            self._phase.pop(key, None)
+
+    def apply(self, key, frames):
+        """
+        Take the next block of a `(frames, channels)` stream. Returns the
+        frames of the hops which ended within it, the mean square of every
+        channel over the window ending with each of those hops (scaled so
+        full scale is 1) and how many frames before the end of the block each
+        hop ended. The hops' frames follow on from the last call's, so are
+        what to give a stateful analyser with `chunk=hop`.
+        """
+        hop, window, keep = self.hop, self.window, self.keep
+        phase = self._phase.get(key, 0)
+        if not phase and len(frames) == hop == window:
+            # The usual case of one window per chunk doesn't need the history
+            self._history[key] = frames
+            x = _as_float(frames)
+            power = np.einsum('i...,i...->...', x, x) / (hop * FULL_SCALE ** 2)
+            return frames, power[None], np.zeros(1, dtype=int)
+
+        history = self._history.get(key)
+        if history is None or history.shape[1:] != frames.shape[1:]:
+            history = np.zeros((keep, ) + frames.shape[1:], dtype=frames.dtype)
+
+        first = hop - phase  # Where in the block the first hop ends
+        count = (phase + len(frames)) // hop
+        ends = first + hop * np.arange(count)
+
+        stream = np.concatenate((history, frames))
+        self._history[key] = stream[len(stream) - keep:]
+        self._phase[key] = (phase + len(frames)) % hop
+
+        # The window ending with each hop, with the window along the last axis
+        x = _as_float(stream) / FULL_SCALE
+        windows = np.lib.stride_tricks.sliding_window_view(x, window, axis=0)[keep - window + first::hop][:count]
+        power = np.einsum('i...j,i...j->i...', windows, windows) / window
+
+        return stream[keep - phase:keep - phase + count * hop], power, len(frames) - ends
+
+
+# Peak detection
+OVERSAMPLING = 4  # How many times over the true peak is sampled at
+PEAK_TAPS = 8     # The length of each phase of the oversampling filter
+
+
+def oversampling_filter(factor=OVERSAMPLING, taps=PEAK_TAPS):
+    """
+    Design the interpolating filter used to find true peaks, as a `(taps,
+    factor)` matrix with a column for each phase. Multiplying the last `taps`
+    samples, oldest first, by it gives `factor` points spread between the
+    sample `taps // 2` before the newest and the one after it. The first
+    phase is exactly that sample.
+    """
+    length = factor * taps
+    # A Kaiser-windowed sinc, centred on a sample so one phase is a delay
+    index = np.arange(length)
+    kernel = np.sinc((index - length / 2) / factor) * np.kaiser(length + 1, 5)[:length]
+    phases = kernel.reshape(taps, factor)[::-1]
+    # Each phase is normalised so steady signals aren't scaled
+    return phases / phases.sum(axis=0)
+
+
+class PeakDetector:
+    """
+    Measures the sample peak and true peak of every channel over each hop of
+    a stream, like `Hopper` does for the level. The true peak is the peak of
+    the signal between the samples, as in ITU-R BS.1770, which can be higher
+    than any sample and is what clips once the audio is converted back to
+    analogue or resampled. It is found by oversampling with a polyphase
+    filter, computed for a whole block at once as a strided view of the
+    samples multiplied by the filter's matrix. The filter's first phase is
+    the samples themselves, so the sample peak comes from the same product.
+
+    The last few samples are kept for each key so the filter follows the
+    stream, along with the peaks so far of a hop which hasn't ended yet.
+    When oversampling, both peaks lag the samples by `taps // 2` frames
+    because of the filter. With a `factor` of 1 there is no oversampling,
+    and the true peak is the same as the sample peak.
+    """
+
+    def __init__(self, hop, factor=OVERSAMPLING, taps=PEAK_TAPS):
+        self.hop = hop
+        self.taps = taps
+        self.filter = None
+        if factor > 1:
+            self.filter = np.ascontiguousarray(oversampling_filter(factor, taps).T, dtype=np.float32)
+
+        self._history = {}
+        self._phase = {}    # The frames since the last hop ended
+        self._partial = {}  # The peaks so far of the hop which hasn't ended
+
+    def reset(self, key=None):
+        """Forget the samples and peaks kept for a key, or for every key."""
+        if key is None:
+            self._history, self._phase, self._partial = {}, {}, {}
+        else:
+            for kept in (self._history, self._phase, self._partial):
+                kept.pop(key, None)
+
+    def _points(self, key, frames):
+        """
+        The magnitude of every point of a `(frames, channels)` block, as a
+        `(phases, channels, frames)` array. The first phase is the samples.
+        """
+        count, channels = frames.shape
+        if self.filter is None:
+            points = np.ascontiguousarray(frames.T, dtype=np.float32)
+            return np.abs(points, out=points)[None]
+
+        # Each channel's history and block are laid out along a row, with a
+        # little room at the end for the last row's windows
+        taps = self.taps
+        width = taps - 1 + count
+        rows = np.zeros(channels * width + taps - 1, dtype=np.float32)
+        grid = rows[:channels * width].reshape(channels, width)
+        history = self._history.get(key)
+        if history is not None and len(history) == channels:
+            grid[:, :taps - 1] = history
+        grid[:, taps - 1:] = frames.T
+        self._history[key] = grid[:, count:]
+
+        # Every window of every channel is viewed straight from the samples,
+        # so all of the phases are found by a single matrix product. Copying
+        # the view into a row per tap first makes the product faster. The
+        # windows which straddle two rows are dropped afterwards.
+        size = rows.itemsize
+        windows = np.ndarray((taps, channels * width), rows.dtype, rows, 0, (size, size))
+        points = self.filter @ np.ascontiguousarray(windows)
+        return np.abs(points, out=points).reshape(-1, channels, width)[:, :, :count]
+
+    def apply(self, key, frames):
+        """
+        Take the next block of a `(frames, channels)` stream. Returns the
+        sample peak and true peak of every channel in each hop which ended
+        within it, as a `(hops, channels, 2)` array scaled to 0-1. The true
+        peak is never less than the sample peak.
+        """
+        points = self._points(key, frames)
+        hop, count = self.hop, len(frames)
+        phase = self._phase.get(key, 0)
+        hops = (phase + count) // hop
+        self._phase[key] = (phase + count) % hop
+
+        if not phase and count == hop:
+            # The usual case of exactly one hop per block
+            peaks = np.maximum.reduce(points, axis=2)[:, :, None]
+        else:
+            if not count:
+                return np.zeros((0, frames.shape[1], 2))
+
+            # The peak of each hop, or part of one, within the block
+            starts = np.arange(-phase, count, hop)
+            starts[0] = 0
+            peaks = np.maximum.reduceat(points, starts, axis=2)
+            if phase:
+                np.maximum(peaks[:, :, 0], self._partial[key], out=peaks[:, :, 0])
+            self._partial[key] = peaks[:, :, hops] if len(starts) > hops else None
+            peaks = peaks[:, :, :hops]
+
+        peaks = np.concatenate((peaks[:1], np.maximum.reduce(peaks, axis=0, keepdims=True)))
+        return peaks.T / FULL_SCALE
+
+
+# Filter design
+def a_weighting(fs):
+    """Compute the constants needed for the A-weighting"""
+    f1 = 20.598997
+    f2 = 107.65265
+    f3 = 737.86223
+    f4 = 12194.217
+    a1000 = 1.9997
+
+    nums = [(2 * np.pi * f4) ** 2 * (10 ** (a1000 / 20)), 0, 0, 0, 0]
+    dens = np.polymul([1, 4 * np.pi * f4, (2 * np.pi * f4) ** 2],
+                      [1, 4 * np.pi * f1, (2 * np.pi * f1) ** 2])
+    dens = np.polymul(np.polymul(dens, [1, 2 * np.pi * f3]),
+                      [1, 2 * np.pi * f2])
+
+    return _signal().bilinear(nums, dens, fs)
+
+
+@functools.lru_cache()
+def design(btype, fs, cutoff=None, order=5):
+    """
+    Design a filter as second-order sections. `btype` is either `'a'` for
+    A-weighting or a Butterworth type such as `'low'` or `'high'`. Designs are
+    cached in memory and in `FILTER_CACHE`, so each rate and setting is only
+    ever computed once.
+    """
+    filename = os.path.join(FILTER_CACHE, '%s-%g-%g-%d.npy' % (btype, fs, cutoff or 0, order))
+    try:
+        sos = np.load(filename)
+        if sos.ndim == 2 and sos.shape[1] == 6:
+            return sos
+    except (OSError, ValueError):
+        pass
+
+    if btype == 'a':
+        sos = _signal().tf2sos(*a_weighting(fs))
+    else:
+        sos = _signal().butter(order, cutoff / (0.5 * fs), btype=btype, analog=False, output='sos')
+
+    # Worker processes may design the same filter at once, so each writes
+    # its own file and moves it into place. Failing to cache isn't an error.
+    try:
+        os.makedirs(FILTER_CACHE, exist_ok=True)
+        temp = '%s.%d' % (filename, os.getpid())
+        with open(temp, 'wb') as file_:
+            np.save(file_, sos)
+        os.replace(temp, filename)
+    except OSError:
+        pass
+    return sos
+
+
+def prepare(rate):
+    """
+    Do the slow parts of setting up the DSP ahead of time, so the first
+    chunks aren't held up by them: importing SciPy and designing the
+    A-weighting filter for `rate`.
+    """
+    _signal()
+    design('a', rate)
+
+
+class StreamingFilter:
+    """
+    An IIR filter which carries its state from one chunk to the next, so a
+    continuous stream is filtered without transients at the chunk edges.
+
+    Samples are filtered along the first axis, so a `(frames, channels)`
+    array has every channel filtered in the same call, each with its own
+    state.
+    """
+
+    def __init__(self, sos):
+        self.sos = sos
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def __call__(self, samples):
+        if self.zi is None or self.zi.shape[2:] != samples.shape[1:]:
+            self.zi = np.zeros((self.sos.shape[0], 2) + samples.shape[1:])
+        out, self.zi = _signal().sosfilt(self.sos, samples, axis=0, zi=self.zi)
+        return out
+
+
+class FilterChain:
+    """
+    Holds one `StreamingFilter` per filter setting and channel. Filters are
+    created the first time they are used and reuse the cached designs.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._filters = {}
+
+    def reset(self, channel=None):
+        """Forget the state of a channel's filters, or every filter, such as after a mode change."""
+        for key, filter_ in self._filters.items():
+            if channel is None or key[1] == channel:
+                filter_.reset()
+
+    def apply(self, btype, channel, samples, cutoff=None, order=5):
+        """Filter a chunk of samples for a given channel"""
+        key = (btype, channel, cutoff, order)
+        if key not in self._filters:
+            self._filters[key] = StreamingFilter(design(btype, self.rate, cutoff, order))
+        return self._filters[key](samples)
+
+
+# Time weighting
+TIME_WEIGHTINGS = {'fast': 0.125, 'slow': 1.0, 'impulse': 0.035}  # Time constants in seconds
+IMPULSE_DECAY = 1.5  # The time constant an impulse-weighted level falls back with
+
+
+class Averager:
+    """
+    Produces the level shown as the average, with state carried from one
+    block to the next for each key. `kind` is one of:
+
+    - `'fast'`, `'slow'` or `'impulse'`: the exponentially time-weighted
+      level, from a one-pole filter over the squared signal. An impulse
+      level rises quickly but is held, only falling at `IMPULSE_DECAY`.
+    - `'leq'`: the energy-equivalent level over the last `window` seconds,
+      which becomes the LAeq when the samples are A-weighted.
+
+    As the filtering is done per sample, the result does not depend on the
+    chunk size, other than the Leq window being a whole number of chunks.
+    """
+
+    def __init__(self, kind, rate, window=60):
+        if kind not in TIME_WEIGHTINGS and kind != 'leq':
+            raise ValueError('Unknown average %r' % kind)
+        self.kind = kind
+        self.rate = rate
+        self.window = window
+
+        self._zi = {}
+        self._held = {}
+        self._history = {}
+
+    def reset(self, key=None):
+        """Forget the levels so far for a key, or every key, such as after a mode change."""
+        if key is None:
+            self._zi, self._held, self._history = {}, {}, {}
+        else:
+            for kept in (self._zi, self._held, self._history):
+                kept.pop(key, None)
+
+    def _filter(self, key, signal, alpha):
+        """Run the one-pole filter for a key over the first axis of `signal`"""
+        zi = self._zi.get(key)
+        if zi is None or zi.shape[1:] != signal.shape[1:]:
+            zi = np.zeros((1, ) + signal.shape[1:])
+        out, self._zi[key] = _signal().lfilter([1 - alpha], [1, -alpha], signal, axis=0, zi=zi)
+        return out
+
+    def _hold(self, key, peaks, decay):
+        """
+        Hold the impulse level, given the log of the peak in each chunk as it
+        stands at the end of that chunk and the log decay per chunk.
+
+        Holding is `held[n] = max(level[n], held[n - 1] * d)`. In logarithms
+        the decay is a constant added each step, so it becomes a running
+        maximum instead of a loop.
+        """
+        steps = (decay * np.arange(len(peaks))).reshape((len(peaks), ) + (1, ) * (peaks.ndim - 1))
+        held = np.maximum.accumulate(peaks - steps, axis=0) + steps
+        if key in self._held:
+            held = np.maximum(held, self._held[key] + steps + decay)
+        self._held[key] = held[-1]
+        return np.exp(held)
+
+    def _leq(self, key, energy, chunk):
+        """The mean square over the last `window` seconds, given each chunk's energy"""
+        window = max(1, round(self.window * self.rate / chunk))
+        count = len(energy)
+
+        # The sums for the chunks still in the window, which start out empty
+        history = self._history.get(key, np.zeros((0, ) + energy.shape[1:]))
+        sums = np.concatenate((history, energy))
+        totals = np.cumsum(np.concatenate((np.zeros((1, ) + energy.shape[1:]), sums)), axis=0)
+
+        ends = np.arange(len(history), len(sums)) + 1
+        starts = np.maximum(ends - window, 0)
+        self._history[key] = sums[max(len(sums) - (window - 1), 0):]
+
+        samples = ((ends - starts) * chunk).reshape((count, ) + (1, ) * (energy.ndim - 1))
+        return (totals[ends] - totals[starts]) / samples
+
+    def apply(self, key, samples, chunk=None):
+        """
+        Return the level as -dB at the end of each chunk in a block of samples,
+        which defaults to being a single chunk. The first axis of the result
+        is the chunk and the rest match `samples`' other axes.
+        """
+        chunk = chunk or len(samples)
+        count = len(samples) // chunk if chunk else 0
+        if not count:
+            # The filter's state would be lost over an empty block
+            return np.zeros((0, ) + samples.shape[1:])
+        squared = np.square(samples[:count * chunk] / FULL_SCALE)
+        by_chunk = (count, chunk) + squared.shape[1:]
+
+        if self.kind == 'leq':
+            return power_to_db(self._leq(key, squared.reshape(by_chunk).sum(axis=1), chunk))
+
+        weighted = self._filter(key, squared, math.exp(-1 / (self.rate * TIME_WEIGHTINGS[self.kind])))
+        if self.kind != 'impulse':
+            return power_to_db(weighted[chunk - 1::chunk])
+
+        # The peak of each chunk as it will have decayed to by its end
+        decay = -1 / (self.rate * IMPULSE_DECAY)
+        ramp = (decay * np.arange(chunk - 1, -1, -1)).reshape((chunk, ) + (1, ) * (squared.ndim - 1))
+        with np.errstate(divide='ignore'):
+            peaks = (np.log(weighted).reshape(by_chunk) + ramp).max(axis=1)
+        return power_to_db(self._hold(key, peaks, decay * chunk))
+
+    def apply_power(self, key, power, chunk):
+        """
+        The same as `apply`, but for signals (such as FFT bands) which are
+        only known as the mean square of each chunk. The signal is treated
+        as being constant through each chunk.
+        """
+        if self.kind == 'leq':
+            return power_to_db(self._leq(key, power * chunk, chunk))
+
+        # Over a constant chunk, the filter is the same as one step with the
+        # per-sample coefficient raised to the chunk length.
+        alpha = math.exp(-chunk / (self.rate * TIME_WEIGHTINGS[self.kind]))
+        weighted = self._filter(key, power, alpha)
+        if self.kind != 'impulse':
+            return power_to_db(weighted)
+
+        with np.errstate(divide='ignore'):
+            peaks = np.log(weighted)
+        return power_to_db(self._hold(key, peaks, -chunk / (self.rate * IMPULSE_DECAY)))
+
+
+# Band analysis
+def octave_bands(rate, fraction=1):
+    """
+    Return the `(lower, upper)` edges of the 1/`fraction` octave bands from
+    IEC 61260's base-ten series, from the 20Hz region up to the highest band
+    that fits below the Nyquist frequency. `fraction` should be odd, such as
+    1 for octaves or 3 for third-octaves.
+    """
+    ratio = 10 ** 0.3
+    bands = []
+    index = math.ceil(fraction * math.log(20 / 1000, ratio))
+    while True:
+        centre = 1000 * ratio ** (index / fraction)
+        lower, upper = centre * ratio ** (-0.5 / fraction), centre * ratio ** (0.5 / fraction)
+        if upper > rate / 2:
+            return bands
+        bands.append((lower, upper))
+        index += 1
+
+
+# ISO 266's preferred numbers, which the bands' nominal centres are named with
+PREFERRED_NUMBERS = (1, 1.25, 1.6, 2, 2.5, 3.15, 4, 5, 6.3, 8, 10)
+
+
+def nominal_frequency(frequency):
+    """The preferred frequency nearest to `frequency`, such as 80Hz for a band centred on 79.4Hz"""
+    decade = 10 ** math.floor(math.log10(frequency))
+    return decade * min(PREFERRED_NUMBERS, key=lambda number: abs(math.log(number * decade / frequency)))
+
+
+def split_bands(rate, frequency):
+    """The two bands, below and above `frequency`, shown in split mode"""
+    return [(0, frequency), (frequency, rate / 2)]
+
+
+class BandAnalyser:
+    """
+    Measures the mean square of the signal in each of a set of frequency
+    bands, using one Hann-windowed FFT of the last `size` samples per chunk.
+
+    The window and a bin-to-band weight matrix are computed once. The matrix
+    also holds the FFT scaling, so the band powers are a single matrix product
+    and the bands of a full-coverage set add up to the mean square of the
+    windowed signal. Bins which straddle a band edge are shared between the
+    bands by how much of the bin falls in each. NumPy caches the FFT's plan
+    for each size, so it is only made once too.
+
+    The last `size` samples are kept for each key, so the analysis follows a
+    stream like the IIR filters do.
+    """
+
+    def __init__(self, rate, size, bands):
+        self.rate = rate
+        self.size = size
+        self.bands = bands
+
+        # A periodic Hann window, as used for spectral analysis
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(size) / size)
+
+        # The range of frequencies each bin covers, clipped to 0-Nyquist
+        freqs = np.fft.rfftfreq(size, 1 / rate)
+        width = rate / size
+        lower = np.clip(freqs - width / 2, 0, rate / 2)
+        upper = np.clip(freqs + width / 2, 0, rate / 2)
+
+        self.weights = np.zeros((len(freqs), len(bands)))
+        for band, (low, high) in enumerate(bands):
+            overlap = np.clip(np.minimum(upper, high) - np.maximum(lower, low), 0, None)
+            self.weights[:, band] = overlap / (upper - lower)
+
+        # The one-sided spectrum holds both halves of every bin but DC and Nyquist
+        scale = np.full(len(freqs), 2.0)
+        scale[0] = 1
+        if size % 2 == 0:
+            scale[-1] = 1
+        self.weights *= (scale / (size * np.sum(self.window ** 2)))[:, None]
+
+        self._history = {}
+
+    def reset(self, key=None):
+        """Forget the samples kept for a key, or for every key."""
+        if key is None:
+            self._history = {}
+        else:
+            self._history.pop(key, None)
+
+    def apply(self, key, samples, chunk=None):
+        """
+        Return the power in each band at the end of each chunk of a block,
+        which defaults to being a single chunk. The result is shaped like
+        `samples`, but with the chunk as its first axis and the band as its
+        last, and is scaled the same as `Hopper`'s mean squares.
+        """
+        chunk = chunk or len(samples)
+        count = len(samples) // chunk
+        samples = samples[:count * chunk] / FULL_SCALE
+
+        history = self._history.get(key)
+        if history is None or history.shape[1:] != samples.shape[1:]:
+            history = np.zeros((self.size, ) + samples.shape[1:])
+
+        if count == 1 and chunk <= self.size:
+            # Shift the newest chunk into the window in place
+            history[:-chunk] = history[chunk:]
+            history[-chunk:] = samples
+            blocks = history[None]
+        else:
+            stream = np.concatenate((history, samples))
+            blocks = np.lib.stride_tricks.sliding_window_view(stream, self.size, axis=0)
+            blocks = np.moveaxis(blocks[chunk::chunk][:count], -1, 1)
+            history = stream[len(stream) - self.size:].copy()
+        self._history[key] = history
+
+        # Transform along the window's axis, which is now the second
+        spectra = np.fft.rfft(blocks * self.window.reshape((self.size, ) + (1, ) * (blocks.ndim - 2)), axis=1)
+        power = np.moveaxis(spectra.real ** 2 + spectra.imag ** 2, 1, -1)
+        return power @ self.weights
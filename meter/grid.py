@@ -1,7 +1,25 @@
+import math
+import threading
+import time
+
 import pygame
 
-from .config import load_config
-CONFIG, _ = load_config()
+from .config import CONFIG
+from .perf import STATS
+
+# Posted by `RootWindow.notify` to wake the main loop when there is new data.
+# Pygame 1.9 (SDL 1.2, as used for the Pi's TFT screen) can't allocate one.
+if hasattr(pygame.event, 'custom_type'):
+    DATA_EVENT = pygame.event.custom_type()
+else:
+    DATA_EVENT = pygame.USEREVENT
+
+# SDL can only sleep until the next event with these video drivers. With any
+# other, such as on the Pi's console, it checks for events every millisecond,
+# so the event queue is only checked once a frame instead. Pygame 1.9 can't
+# wait with a timeout at all.
+WAITABLE_DRIVERS = ('x11', 'wayland', 'windows', 'cocoa')
+CAN_WAIT = pygame.version.vernum[0] >= 2
 
 
 class Manager:
@@ -25,6 +43,17 @@ class Manager:
             elif hasattr(self._children, "remove"):
                 # For root-level managers, _children might be a list
                 self._children.remove(child)
+            self.invalidate()
+
+    def invalidate(self):
+        """Discard any cached layout or surface held by the children."""
+        for child in list(self._children):
+            child.invalidate()
+
+    def restyle(self):
+        """Make every child re-draw from scratch, such as after the config has changed."""
+        for child in list(self._children):
+            child.restyle()
 
     def request_position(self, child):
         return 0, 0
@@ -32,49 +61,87 @@ class Manager:
     def request_size(self, child):
         return 0, 0
 
-    def render(self, surface, position):
-        """Request re-draws from children then push to the screen."""
+    def render(self, surface, position, force=False):
+        """
+        Request re-draws from children then push to the screen. Only children
+        marked as `.dirty` are re-drawn unless `force` is set. A list of the
+        areas that were drawn to is returned.
+        """
+        rects = []
         for child in self._children:
             rel_pos = self.request_position(child)
             if not isinstance(child, Manager):
-                pos = (rel_pos[0] + position[0] + CONFIG.get('padding', 0.5),
-                       rel_pos[1] + position[1] + CONFIG.get('padding', 0.5))
+                # Resolving the surface after a layout change marks it dirty
+                child_surface = child.surface
+                if not (force or child.dirty):
+                    continue
 
+                pos = (rel_pos[0] + position[0] + CONFIG.padding,
+                       rel_pos[1] + position[1] + CONFIG.padding)
+
+                # Clear the flag first so changes made mid-render aren't lost
+                child.dirty = False
+                start = time.perf_counter()
                 child.render()
-                surface.blit(child.surface, pos)
+                STATS.pane(type(child).__name__, time.perf_counter() - start)
+                if child.captured is not None:
+                    # Only counted once, not again on every forced re-draw
+                    STATS.rendered(child.captured)
+                    child.captured = None
+                rects.append(surface.blit(child_surface, pos))
             else:
                 pos = (rel_pos[0] + position[0],
                        rel_pos[1] + position[1])
 
-                child.render(surface, pos)
+                rects.extend(child.render(surface, pos, force))
+        return rects
 
-    def event(self, event, position):
-        """Propagate an event through all the children."""
-        for child in list(self._children.keys()):
+    def hit_test(self, point, position):
+        """Return the visible children under a point, given where this manager is."""
+        found = []
+        for child in self._children:
             pos = self.request_position(child)
-            pos = (pos[0] + position[0], pos[1] + position[1])
-            if not hasattr(event, 'pos'):
-                if isinstance(child, Manager):
-                    child.event(event, pos)
-                    continue
-                child.event(event)
-                continue
+            rect = pygame.Rect(pos[0] + position[0], pos[1] + position[1], *self.request_size(child))
+            if child.visible and rect.collidepoint(point):
+                found.append(child)
+        return found
+
+    def wants(self, event_type):
+        """Whether any of the children handle events of this type."""
+        return any(child.wants(event_type) for child in self._children)
+
+    def event(self, event, position):
+        """
+        Propagate an event to the children which handle it. Events with a
+        position only go to the children under it.
+        """
+        if not self.wants(event.type):
+            return
 
-            if not child.visible: continue
-            size = self.request_size(child)
-            rect = pygame.Rect(*pos, *size)
+        if hasattr(event, 'pos'):
+            targets = self.hit_test(event.pos, position)
+        else:
+            targets = list(self._children)
 
-            if rect.collidepoint(*event.pos):
-                if isinstance(child, Manager):
-                    child.event(event, pos)
-                else:
-                    child.event(event)
+        for child in targets:
+            if not child.wants(event.type):
+                continue
+            if isinstance(child, Manager):
+                pos = self.request_position(child)
+                child.event(event, (pos[0] + position[0], pos[1] + position[1]))
+            else:
+                child.event(event)
 
     def tick(self):
         """Propagate a tick through all the children."""
         for child in list(self._children.keys()):
             child.tick()
 
+    @property
+    def dirty(self):
+        """Whether any of the children need re-drawing"""
+        return any(child.dirty for child in self._children)
+
     @property
     def children(self):
         return len(self._children)
@@ -85,8 +152,30 @@ class Gridable:
     def __init__(self, *args, **kwargs):
         self._parent = None
         self.visible = True
-        self.row_span = kwargs.get('row_span', 1)
-        self.col_span = kwargs.get('col_span', 1)
+        self._row_span = kwargs.get('row_span', 1)
+        self._col_span = kwargs.get('col_span', 1)
+
+    @property
+    def row_span(self):
+        return self._row_span
+
+    @row_span.setter
+    def row_span(self, row_span):
+        if row_span != self._row_span:
+            self._row_span = row_span
+            if self._parent is not None:
+                self._parent.invalidate()
+
+    @property
+    def col_span(self):
+        return self._col_span
+
+    @col_span.setter
+    def col_span(self, col_span):
+        if col_span != self._col_span:
+            self._col_span = col_span
+            if self._parent is not None:
+                self._parent.invalidate()
 
     @property
     def parent(self):
@@ -113,54 +202,112 @@ class Gridable:
 
 
 class Pane(Gridable):
-    """This represents a child that provides a surface for drawing onto."""
+    """
+    This represents a child that provides a surface for drawing onto.
+
+    Panes are opaque by default. Set `opaque` to `False` for panes, such as
+    overlays, which need an alpha channel.
+
+    Panes showing audio levels should set `captured` to the capture time of
+    the newest chunk they show, so the latency to the screen can be measured.
+    It is cleared once the pane has been drawn.
+
+    Only events whose type is in `events` are passed to `event`.
+    """
+    opaque = True
+    events = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._surface = None
-
-    @property
-    def surface(self):
+        self._resolved = False
+        self.dirty = True  # Set whenever the pane needs re-drawing
+        self.captured = None
+
+        self._static = {}
+        self._static_size = None
+
+    def invalidate(self):
+        """Called by the parent when the layout changes."""
+        self._resolved = False
+
+    def restyle(self):
+        """Called when the config has been reloaded. Drops anything drawn with the old settings."""
+        self._static = {}
+        self.dirty = True
+
+    def new_surface(self, size):
+        """Allocate a surface in the cheapest pixel format for this pane."""
+        if self.opaque:
+            return pygame.Surface(size).convert()
+        return pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+
+    def resolve(self):
+        """Fetch our size from the parent and reallocate the surface if needed."""
         assert self.parent is not None
 
         size = self.parent.request_size(self)
-        size = (size[0] - CONFIG.get('padding', 0.5) * 2,
-                size[1] - CONFIG.get('padding', 0.5) * 2)
-        if self._surface is None:
-            self._surface = pygame.Surface(size).convert_alpha()
-        elif self._surface.get_size() != size:
-            surf = pygame.Surface(size).convert_alpha()
-            surf.blit(self._surface, (0, 0))
-            self._surface = surf
+        size = (int(size[0] - CONFIG.padding * 2),
+                int(size[1] - CONFIG.padding * 2))
+        if self._surface is None or self._surface.get_size() != size:
+            self._surface = self.new_surface(size)
+            self.dirty = True
+        self._resolved = True
+
+    def static_layer(self, key, draw):
+        """
+        Return a retained surface for the parts of the pane which only change
+        with `key`. `draw` is called with a blank surface to build a layer the
+        first time a key is seen. Every layer is dropped when the size changes.
+        """
+        size = self.surface.get_size()
+        if size != self._static_size:
+            self._static = {}
+            self._static_size = size
 
+        if key not in self._static:
+            layer = self.new_surface(size)
+            draw(layer)
+            self._static[key] = layer
+        return self._static[key]
+
+    @property
+    def surface(self):
+        if not self._resolved:
+            self.resolve()
         return self._surface
 
     def render(self):
         """This method is called when the manager desires a re-draw."""
         pass
 
+    def wants(self, event_type):
+        return event_type in self.events
+
     def event(self, event):
         """This method is called with any propagated events."""
         pass
 
-    def outline_and_fill(self, bg, mg):
-        size = self.surface.get_size()
+    def outline_and_fill(self, bg, mg, surface=None):
+        surface = self.surface if surface is None else surface
+        size = surface.get_size()
 
-        self.surface.fill(bg)
-        self.surface.set_at((0, 0), (0, 0, 0))
-        self.surface.set_at((size[0] - 1, 0), (0, 0, 0))
-        self.surface.set_at((0, size[1] - 1), (0, 0, 0))
-        self.surface.set_at((size[0] - 1, size[1] - 1), (0, 0, 0))
+        surface.fill(bg)
+        surface.set_at((0, 0), (0, 0, 0))
+        surface.set_at((size[0] - 1, 0), (0, 0, 0))
+        surface.set_at((0, size[1] - 1), (0, 0, 0))
+        surface.set_at((size[0] - 1, size[1] - 1), (0, 0, 0))
 
         if mg:
-            x = CONFIG.get('colour_padding', 4)
-            y = CONFIG.get('colour_padding', 4)
-            w = size[0] - CONFIG.get('colour_padding', 4) * 2
-            h = size[1] - CONFIG.get('colour_padding', 4) * 2
+            x = CONFIG.colour_padding
+            y = CONFIG.colour_padding
+            w = size[0] - CONFIG.colour_padding * 2
+            h = size[1] - CONFIG.colour_padding * 2
 
-            pygame.draw.rect(self.surface, mg, (x + 1, y, w - 2, h))
-            pygame.draw.line(self.surface, mg, (x, y + 1), (x, y + h - 2))
-            pygame.draw.line(self.surface, mg, (w + x - 1, y + 1), (w + x - 1, y + h - 2))
+            pygame.draw.rect(surface, mg, (x + 1, y, w - 2, h))
+            pygame.draw.line(surface, mg, (x, y + 1), (x, y + h - 2))
+            pygame.draw.line(surface, mg, (w + x - 1, y + 1), (w + x - 1, y + h - 2))
 
 
 class GridingManager(Gridable, Manager):
@@ -176,6 +323,18 @@ class GridingManager(Gridable, Manager):
         self.rows = 0
         self.columns = 0
 
+        # Maps each child to its position and size. This is only recomputed
+        # after `invalidate` is called.
+        self._layout = None
+        self._size = (0, 0)
+
+        # The children covering each cell of the grid, so a point can be
+        # resolved to a child without checking every one. Built along with
+        # the layout.
+        self._cells = {}
+        self._cell_size = (0, 0)
+        self._wants = {}
+
     def grid(self, child, column, row):
         """Add a new child into the gridding system."""
         assert isinstance(child, Gridable)
@@ -184,28 +343,93 @@ class GridingManager(Gridable, Manager):
         self._children[child] = (column, row)
 
         child.parent = self
+        self.invalidate()
         return child
 
+    def clear(self):
+        """Remove every child and shrink the grid back to nothing."""
+        self._children.clear()
+        self.rows = 0
+        self.columns = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Discard the cached layout so it is computed again when next needed."""
+        self._layout = None
+        self._wants = {}
+        super().invalidate()
+
+    def layout(self):
+        """Compute the position and size of every child in a single pass."""
+        if self._layout is not None:
+            return self._layout
+
+        self_size = self._size = self.parent.request_size(self)
+        layout = {}
+        cells = {}
+        if self.columns and self.rows:
+            pos_w = self_size[0] / self.columns
+            pos_h = self_size[1] / self.rows
+            cell_w = self_size[0] // self.columns
+            cell_h = self_size[1] // self.rows
+
+            for order, (child, (column, row)) in enumerate(self._children.items()):
+                layout[child] = ((pos_w * column, pos_h * row),
+                                 (cell_w * child.col_span, cell_h * child.row_span))
+
+                for x in range(column, column + child.col_span):
+                    for y in range(row, row + child.row_span):
+                        cells.setdefault((x, y), []).append((order, child))
+            self._cell_size = (pos_w, pos_h)
+
+        self._layout = layout
+        self._cells = cells
+        return layout
+
+    def hit_test(self, point, position):
+        """Return the visible children under a point, by looking up its cell."""
+        layout = self.layout()
+        if not self._cells:
+            return []
+
+        # Rects are truncated to whole pixels, so a child can start up to a
+        # pixel before its cell. The next cell along is checked too.
+        x = point[0] - position[0]
+        y = point[1] - position[1]
+        width, height = self._cell_size
+        candidates = set()
+        for column in {int(x // width), int((x + 1) // width)}:
+            for row in {int(y // height), int((y + 1) // height)}:
+                candidates.update(self._cells.get((column, row), ()))
+
+        found = []
+        for _, child in sorted(candidates, key=lambda candidate: candidate[0]):
+            pos, size = layout[child]
+            rect = pygame.Rect(pos[0] + position[0], pos[1] + position[1], *size)
+            if child.visible and rect.collidepoint(point):
+                found.append(child)
+        return found
+
+    def wants(self, event_type):
+        """Whether any of the children handle events of this type, remembered until the children change."""
+        if event_type not in self._wants:
+            self._wants[event_type] = Manager.wants(self, event_type)
+        return self._wants[event_type]
+
+    # `Gridable.tick` would otherwise stop ticks reaching the children
+    tick = Manager.tick
+
     def request_position(self, child):
         """Compute the relative location for any given child."""
-        if child not in self._children: return 0, 0
-        self_size = self.parent.request_size(self)
-
-        cell_w = self_size[0] / self.columns
-        cell_h = self_size[1] / self.rows
-
-        return cell_w * self._children[child][0], cell_h * self._children[child][1]
+        layout = self.layout()
+        if child not in layout: return 0, 0
+        return layout[child][0]
 
     def request_size(self, child):
         """Compute the desired size for any given child."""
-        self_size = self.parent.request_size(self)
-        if child not in self._children: return self_size
-
-        cell_w = self_size[0] // self.columns
-        cell_h = self_size[1] // self.rows
-
-        return (cell_w * child.col_span,
-                cell_h * child.row_span)
+        layout = self.layout()
+        if child not in layout: return self._size
+        return layout[child][1]
 
 
 class SingleManager(Manager):
@@ -252,6 +476,11 @@ class RootWindow(Manager):
     It allows for a single child to be attached. This is recommended to be a
     manager, although any `Griddable` element is accepted.
 
+    Frames are only drawn when something has changed, and at most `fps`
+    times a second. Between frames the main loop sleeps until an event
+    arrives, so anything feeding panes from another thread should call
+    `notify` to wake it.
+
     TODO: Allow for multiple stacked children.
     """
     def __init__(self, screen):
@@ -259,36 +488,116 @@ class RootWindow(Manager):
 
         self._screen = screen
         self._children = []
-        self.clock = pygame.time.Clock()
 
         self.running = True
+        self._redraw = True
+        self._notified = False
+        self._wake = threading.Event()
+        self._last_frame = 0
+
+        # Callbacks for key presses, by key
+        self.keys = {}
+
+        # Callbacks run before each frame could be drawn, to bring in data
+        # from other threads while nothing is being drawn
+        self.updates = []
+
+        CONFIG.watch(self.on_config_reload)
+
+    def on_config_reload(self):
+        """Re-draw everything with the new colours and sizes"""
+        self.restyle()
+        self.invalidate()
+        self.redraw()
+
+    def redraw(self):
+        """Force the next render to re-draw the entire screen."""
+        self._redraw = True
+
+    def notify(self):
+        """
+        Wake the main loop to draw new data. This is safe to call from any
+        thread. Later calls are ignored until the loop is about to draw a
+        frame or go idle, as until then it won't sleep past the next frame and
+        the updates before that will bring in their data.
+        """
+        if not self._notified:
+            self._notified = True
+            try:
+                pygame.event.post(pygame.event.Event(DATA_EVENT))
+            except pygame.error:
+                # The display was closed while a stream was mid-chunk
+                return
+            self._wake.set()
+
+    @property
+    def dirty(self):
+        return self._redraw or super().dirty
 
     def render(self, *args):
         """Request that the child elements perform a render check."""
-        self._screen.fill(CONFIG.get('border_colour', (0, 0, 0)))
+        # Overlays are drawn on top of the panes below them, so while one is
+        # open it is simplest to re-draw everything.
+        force = self._redraw or len(self._children) > 1
+        self._redraw = False
+
+        if force:
+            self._screen.fill(CONFIG.border_colour)
 
+        rects = []
         for c in self._children:
-            c.render(self._screen, (0, 0))
+            rects.extend(c.render(self._screen, (0, 0), force))
 
-        pygame.display.update()
+        if force:
+            pygame.display.update()
+        elif rects:
+            pygame.display.update(rects)
+        STATS.displayed()
 
-    def events(self):
-        """Collect all pending events, handle core ones, then propagate."""
-        self.clock.tick(CONFIG.get('fps', 30))
+    def events(self, timeout=0):
+        """
+        Wait up to `timeout` seconds for an event, then handle every pending
+        one and propagate them.
+        """
+        CONFIG.poll()
 
-        event = pygame.event.poll()
+        event = self.wait(timeout)
         while event.type != pygame.NOEVENT:
-            if event.type == pygame.VIDEORESIZE:
-                self._screen = pygame.display.set_mode(event.size, (not CONFIG.get('rpi')) * pygame.RESIZABLE, 32)
+            if event.type == DATA_EVENT:
+                # The new data has already marked its panes as dirty
+                pass
+            elif event.type == pygame.VIDEORESIZE:
+                self._screen = pygame.display.set_mode(event.size, (not CONFIG.rpi) * pygame.RESIZABLE, 32)
+                self.invalidate()
+                self.redraw()
             elif event.type == pygame.QUIT:
                 self.running = False
                 return
+            elif event.type == pygame.KEYDOWN and event.key in self.keys:
+                self.keys[event.key]()
 
-            if self._children:
+            if self._children and self._children[-1].wants(event.type):
                 self._children[-1].event(event, (0, 0))
 
             event = pygame.event.poll()
-        pygame.time.wait(10)
+
+    def wait(self, timeout):
+        """Return the first event to arrive within `timeout` seconds, or `NOEVENT`."""
+        if timeout <= 0:
+            return pygame.event.poll()
+        if CAN_WAIT and pygame.display.get_driver() in WAITABLE_DRIVERS:
+            return pygame.event.wait(math.ceil(timeout * 1000))
+
+        # `notify` wakes this straight away, so only input waits for the poll
+        poll = 1 / CONFIG.fps
+        end = time.perf_counter() + timeout
+        while True:
+            event = pygame.event.poll()
+            remaining = end - time.perf_counter()
+            if event.type != pygame.NOEVENT or remaining <= 0:
+                return event
+            self._wake.wait(min(remaining, poll))
+            self._wake.clear()
 
     def tick(self):
         """Give all children a chance to process frame-based logic"""
@@ -303,20 +612,57 @@ class RootWindow(Manager):
             child = nc
         self._children.append(child)
         child.parent = self
+        child.invalidate()
+        self.redraw()
 
         return child
 
+    def remove(self, child):
+        """Remove a child, such as when an overlay is dismissed."""
+        super().remove(child)
+        self.redraw()
+
     def remove_child(self, child):
         """Remove a child from this parent."""
         if child in self._children:
             self._children.remove(child)
             child.parent = None
+            self.redraw()
         return child
 
     def request_size(self, child):
         """This implements the expected method of any `Manager`."""
         return self._screen.get_size()
 
+    def step(self, idle=1):
+        """
+        Run the main loop once. If anything needs re-drawing this waits for
+        events until the next frame is due, otherwise for up to `idle`
+        seconds. A frame is then drawn if it is due and anything has changed.
+        Returns whether a frame was drawn.
+        """
+        due = self._last_frame + 1 / CONFIG.fps
+        if self.dirty:
+            self.events(due - time.perf_counter())
+        else:
+            self.events(idle)
+        self.tick()
+
+        # Cleared before the updates, so data arriving after them wakes the
+        # next step. While a frame is waiting to be drawn nothing needs waking.
+        now = time.perf_counter()
+        draw = now >= due
+        if draw or not self.dirty:
+            self._notified = False
+        for update in self.updates:
+            update()
+
+        if not draw or not self.dirty:
+            return False
+        self._last_frame = now
+        self.render()
+        return True
+
     def mainloop(self):
         """
         Take control of the thread and process all events.
@@ -324,7 +670,5 @@ class RootWindow(Manager):
         THIS IS A BLOCKING CALL. It will never return while the widow is still open.
         """
         while self.running:
-            self.render()
-            self.events()
-            self.tick()
+            self.step()
         pygame.quit()
@@ -0,0 +1,187 @@
+"""
+A compact, append-only log of every level the meter shows.
+
+Each level is stored as a fixed-width binary record of the time (seconds since
+the epoch), the input it was measured on and the level in -dB. Records are
+collected into a preallocated batch and written out by a background thread, so
+the audio threads never touch the disk. A new file is started each (UTC) day,
+and files older than the retention period are deleted.
+
+As the records are fixed-width and in time order, a day's file can be
+memory-mapped and searched with `numpy.searchsorted` without reading it all.
+"""
+import argparse
+import csv
+import datetime
+import glob
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+RECORD = np.dtype([('time', '<f8'), ('input', '<u2'), ('level', '<f4')])
+
+# The magic, format version and record size at the start of every file
+HEADER = struct.Struct('<8sHH4x')
+MAGIC = b'SPLLEVEL'
+VERSION = 1
+
+DAY = 24 * 60 * 60
+
+
+def log_name(directory, timestamp):
+    """The file holding the records for the day `timestamp` falls on"""
+    day = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return os.path.join(directory, day.strftime('levels-%Y%m%d.bin'))
+
+
+class LevelLogger:
+    """
+    Writes levels to rotating files in `directory`. `add` is safe to call
+    from several threads and only copies the level into memory. Levels added
+    while the batch is full, because the disk has stalled, are counted in
+    `.dropped`.
+    """
+
+    def __init__(self, directory, days=30, interval=1, batch=65536):
+        self.directory = directory
+        self.days = days
+        self.interval = interval
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Capture times come from `time.perf_counter`
+        self._offset = time.time() - time.perf_counter()
+        self._last = 0
+
+        self._lock = threading.Lock()
+        self._batch = np.zeros(batch, dtype=RECORD)
+        self._spare = np.zeros(batch, dtype=RECORD)
+        self._count = 0
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, captured, index, level):
+        """Log a level measured on a chunk captured at `captured`."""
+        with self._lock:
+            if self._count == len(self._batch):
+                self.dropped += 1
+                return
+
+            # Streams are handled on separate threads, so their chunks can
+            # arrive slightly out of order. Files must stay sorted by time.
+            self._last = max(self._last, captured + self._offset)
+            self._batch[self._count] = (self._last, index, level)
+            self._count += 1
+
+    def flush(self):
+        """Write out every level added so far."""
+        with self._lock:
+            records = self._batch[:self._count]
+            self._batch, self._spare = self._spare, self._batch
+            self._count = 0
+
+        while len(records):
+            # Split the batch where it crosses into a new day
+            filename = log_name(self.directory, records['time'][0])
+            end = (records['time'][0] // DAY + 1) * DAY
+            split = np.searchsorted(records['time'], end)
+
+            with open(filename, 'ab') as log:
+                if log.tell() == 0:
+                    log.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+                log.write(records[:split].tobytes())
+            records = records[split:]
+
+    def expire(self):
+        """Delete any files older than the retention period."""
+        oldest = os.path.basename(log_name(self.directory, time.time() - self.days * DAY))
+        for filename in glob.glob(os.path.join(self.directory, 'levels-*.bin')):
+            if os.path.basename(filename) < oldest:
+                os.remove(filename)
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            self.flush()
+            if self.days:
+                self.expire()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self.flush()
+
+
+class LevelReader:
+    """Memory-maps the records in a single log file."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as log:
+            magic, version, size = HEADER.unpack(log.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or size != RECORD.itemsize:
+            raise ValueError('%s is not a level log' % filename)
+
+        # A record cut short by a crash is ignored
+        count = (os.path.getsize(filename) - HEADER.size) // RECORD.itemsize
+        if count:
+            self.records = np.memmap(filename, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count, ))
+        else:
+            self.records = np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def range(self, start, end, index=None):
+        """Return the records from `start` up to (but not including) `end`."""
+        times = self.records['time']
+        lo, hi = np.searchsorted(times, (start, end))
+        records = self.records[lo:hi]
+        if index is not None:
+            records = records[records['input'] == index]
+        return records
+
+
+def query(directory, start, end, index=None):
+    """Return the records between two times from every file they span."""
+    found = []
+    day = start // DAY * DAY
+    while day < end:
+        filename = log_name(directory, day)
+        if os.path.exists(filename):
+            found.append(LevelReader(filename).range(start, end, index))
+        day += DAY
+    return np.concatenate(found) if found else np.zeros(0, dtype=RECORD)
+
+
+def parse_time(value):
+    """Parse an ISO 8601 time, taken to be UTC unless it says otherwise"""
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export part of the level log as CSV.')
+    parser.add_argument('directory', help='the directory the log is kept in')
+    parser.add_argument('start', type=parse_time, help='the first time to export, such as 2024-01-31T09:00')
+    parser.add_argument('end', type=parse_time, help='the time to export up to')
+    parser.add_argument('--input', type=int, help='only export one input')
+    args = parser.parse_args(argv)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['time', 'input', 'level'])
+    for record in query(args.directory, args.start, args.end, args.input):
+        writer.writerow(['%.4f' % record['time'], record['input'], '%.2f' % record['level']])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,27 @@
+import collections
 import threading
-import struct
-import math
+import time
 import os
 
-import scipy.signal
-import numpy as np
 import pyaudio
 import pygame
 
-from .config import load_config
-from .widgets import Button, Indicator, Graph, VUMeter, MessageBox
+from .config import CONFIG
+from .capture import BlockingCapture, CallbackCapture
+from .buffers import RingBuffer, SlidingWindow
+from . import dsp
+from .perf import STATS
+from .levellog import LevelLogger
+from .widgets import Button, Indicator, Graph, VUMeter, PerfPane, MessageBox
 from .grid import GridingManager, RootWindow
 from .enums import *
 
-CONFIG, NEW_CONFIG = load_config()
-if CONFIG.get('rpi'):
+if CONFIG.rpi:
     # When using the TFT screen on the Raspberry Pi, SDL still expects a
     # standard screen so we force it to connect to a seperate frame-buffer/
     # input selection.
-    os.environ['SDL_VIDEODRIVER'] = 'fbcon'
+    # An explicitly set video driver (such as the benchmark's) wins.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'fbcon')
     os.environ['SDL_FBDEV'] = '/dev/fb1'
     os.environ['SDL_MOUSEDRV'] = 'TSLIB'
     os.environ['SDL_MOUSEDEV'] = '/dev/input/touchscreen'
@@ -31,6 +34,10 @@ SPEECH_BTN = 1
 SPLIT_BTN = 2
 GRAPH_BTN = 3
 
+# The latest level of an input, published by its stream's thread. Readings are
+# replaced rather than changed, so the main thread always sees a whole one.
+Reading = collections.namedtuple('Reading', 'level average state captured peak true_peak held')
+
 CONFIG_MESSAGE = """No config file was found.
 The default has been loaded.
 
@@ -38,68 +45,146 @@ You should probably close this
 and setup the audio inputs."""
 
 
-def a_weighting(fs):
-    """Compute the constants needed for the A-weighting"""
-    f1 = 20.598997
-    f2 = 107.65265
-    f3 = 737.86223
-    f4 = 12194.217
-    a1000 = 1.9997
-
-    nums = [(2 * np.pi * f4) ** 2 * (10 ** (a1000 / 20)), 0, 0, 0, 0]
-    dens = np.polymul([1, 4 * np.pi * f4, (2 * np.pi * f4) ** 2],
-                      [1, 4 * np.pi * f1, (2 * np.pi * f1) ** 2])
-    dens = np.polymul(np.polymul(dens, [1, 2 * np.pi * f3]),
-                      [1, 2 * np.pi * f2])
-
-    return scipy.signal.bilinear(nums, dens, fs)
-
-
 class Meter:
-    def __init__(self):
-        self.screen = self.root = self.box = self.graph = self.vu_p = None
+    """
+    Ties the audio inputs to the interface. `sources` can be given to use
+    something other than PyAudio devices, such as the synthetic sources in
+    `meter.sources`. They must provide the same `read` method and `stamps`
+    as the capture classes in `meter.capture`.
+    """
+
+    def __init__(self, sources=None):
+        self.mark('imports')
+        self.started = False
+
+        self.screen = self.root = self.box = self.panel = self.graph = self.vu_p = self.perf = None
         self.buttons, self.indicators = [], []
-
+        self.show_perf = False
+        self.sources, self.pool, self.audio = [], None, None
+        self.threads = []
+
+        # Every channel of every stream is metered as its own input. There is
+        # always room for at least two, as split mode emulates a second.
+        self.channels = CONFIG.channels
+        self.streams = 2 if CONFIG.line_in else 1
+        self.inputs = max(2, self.channels * self.streams)
+
+        # Levels are passed from the stream threads to the main thread as
+        # readings, along with every level for the graph
+        self.readings = [None] * self.inputs
+        self.shown = [None] * self.inputs
+        self.graph_levels = [RingBuffer(CONFIG.graph_samples, float) for _ in range(self.inputs)]
+
+        # Show the interface before anything slow, such as opening the inputs
         self.setup_display()
+        CONFIG.watch(self.on_config_reload)
+        self.root.updates.append(self.update)
+        self.root.render()
+        self.mark('display')
+
+        self.loud = CONFIG.loud_music
+        self.quiet = CONFIG.quiet_music
+
+        # The average shown is either the quietest of the last few samples or
+        # a time-weighted level calculated alongside the RMS.
+        self.averages = [SlidingWindow(CONFIG.average_samples) for _ in range(self.inputs)]
+        self.averager = None
+        if CONFIG.average != 'min':
+            self.averager = dsp.Averager(CONFIG.average, CONFIG.rate, CONFIG.leq_window)
+
+        # Filter coefficients are designed once and their state is kept from
+        # chunk to chunk for each input.
+        self.filters = dsp.FilterChain(CONFIG.rate)
+
+        # Levels are measured every hop rather than every chunk captured
+        self.hop = CONFIG.hop or CONFIG.chunk
+        self.hopper = dsp.Hopper(self.hop, CONFIG.window)
+
+        # The loudest true peak is held for a while, as the -dB minimum
+        self.peaks = dsp.PeakDetector(self.hop, dsp.OVERSAMPLING if CONFIG.true_peak else 1)
+        hold = max(1, round(CONFIG.peak_hold * CONFIG.rate / self.hop))
+        self.holds = [SlidingWindow(hold) for _ in range(self.inputs)]
+
+        # Split mode measures two bands from an FFT of the latest samples
+        self.bands = dsp.BandAnalyser(CONFIG.rate, CONFIG.band_fft_size,
+                                      dsp.split_bands(CONFIG.rate, CONFIG.split_frequency))
+
+        # The A/W and SPLIT modes each stream's DSP state was built up in. Only
+        # the stream's own thread resets the state, once it sees them change.
+        self.modes = [None] * self.streams
+
+        if sources is None:
+            # Connect to input devices
+            self.audio = pyaudio.PyAudio()
+            sources = [self.open_input(CONFIG.device_1_id)]
+            if CONFIG.line_in:
+                sources.append(self.open_input(CONFIG.device_2_id))
+        self.sources = sources
+
+        # Every level shown can be kept on disk
+        self.level_log = None
+        if CONFIG.level_log:
+            self.level_log = LevelLogger(CONFIG.level_log, CONFIG.level_log_days, CONFIG.level_log_interval)
+
+        # The DSP can run in worker processes, leaving this one to render
+        self.pool = None
+        target = self.read_stream
+        if CONFIG.dsp_backend == 'process':
+            # Shared memory needs Python 3.8, so only this backend imports it
+            from .workers import DSPPool
+            self.pool = DSPPool(sources, CONFIG.rate, CONFIG.chunk, self.channels, CONFIG.dsp_workers,
+                                CONFIG.split_frequency, CONFIG.buffer_chunks, CONFIG.average, CONFIG.leq_window,
+                                CONFIG.band_fft_size, self.hop, CONFIG.window, CONFIG.true_peak)
+            self.set_modes()
+            target = self.read_results
+
+        # Start stream listeners
+        for index in range(self.streams):
+            thread = threading.Thread(target=target, args=(index, ))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        self.mark('audio')
 
-        self.loud = CONFIG.get('loud_music', 3)
-        self.quiet = CONFIG.get('quiet_music', 15)
-
-        self.audio = pyaudio.PyAudio()
-
-        # Connect to input devices and start stream listeners
-        self.stream1 = self.audio.open(
-            format=CONFIG.get('format', 8),
-            channels=CONFIG.get('channels', 1),
-            rate=CONFIG.get('rate', 44100),
-            input=True,
-            frames_per_buffer=CONFIG.get('chunk', '1024'),
-            input_device_index=CONFIG.get('device_1_id', 1))
-        thread = threading.Thread(target=self.read_stream1)
+        # SciPy is loaded while the first chunks are being captured
+        thread = threading.Thread(target=self.prepare_dsp)
         thread.daemon = True
         thread.start()
-        if CONFIG.get('line_in'):
-            self.stream2 = self.audio.open(
-                format=CONFIG.get('format', 8),
-                channels=CONFIG.get('channels', 1),
-                rate=CONFIG.get('rate', 44100),
-                input=True,
-                frames_per_buffer=CONFIG.get('chunk', '1024'),
-                input_device_index=CONFIG.get('device_2_id', 1))
-
-            thread = threading.Thread(target=self.read_stream2)
+
+        if CONFIG.perf_log:
+            thread = threading.Thread(target=self.log_perf)
             thread.daemon = True
             thread.start()
 
+    def open_input(self, device):
+        """Open an input device using the configured capture mode"""
+        kwargs = dict(format=CONFIG.format, channels=CONFIG.channels, rate=CONFIG.rate)
+        if CONFIG.capture == 'callback':
+            return CallbackCapture(self.audio, device, CONFIG.chunk, CONFIG.buffer_chunks, **kwargs)
+        return BlockingCapture(self.audio, device, CONFIG.chunk, **kwargs)
+
+    def mark(self, step):
+        """Record a step of starting up, reporting the timings once every step has finished"""
+        if STATS.mark(step) and CONFIG.startup_report:
+            print(STATS.startup_summary())
+
+    def prepare_dsp(self):
+        """Do the slow parts of setting up the DSP, off the main thread"""
+        if self.pool is not None:
+            self.pool.wait_ready()
+        else:
+            dsp.prepare(CONFIG.rate)
+        self.mark('dsp')
+
     def setup_display(self):
         """
         Form our screen, create the gridding manager, create and bind the panes
         to the manager then bind callbacks to the buttons.
         """
 
-        self.screen = pygame.display.set_mode((CONFIG.get('screen_width', 0), CONFIG.get('screen_height', 0)),
-                                              (not CONFIG.get('rpi')) * pygame.RESIZABLE, 32)
-        if CONFIG.get('rpi'):
+        self.screen = pygame.display.set_mode((CONFIG.screen_width, CONFIG.screen_height),
+                                              (not CONFIG.rpi) * pygame.RESIZABLE, 32)
+        if CONFIG.rpi:
             # When running an X session straight from the console, the cursor
             # will stay in the corner. Let's hide it.
             pygame.mouse.set_visible(False)
@@ -110,43 +195,71 @@ class Meter:
 
         labels = ['A/W', 'SPEECH', 'SPLIT', 'GRAPH']
         self.buttons = [self.box.grid(Button(text=labels[i]), 0, i) for i in range(4)]
+        self.buttons[AW_BTN    ].callback = self.on_aw_tog_click
         self.buttons[SPEECH_BTN].callback = self.on_speech_tog_click
         self.buttons[SPLIT_BTN ].callback = self.on_split_tog_click
         self.buttons[GRAPH_BTN ].callback = self.on_graph_tog_click
 
-        self.buttons[SPLIT_BTN].disabled = CONFIG.get('line_in', False)
+        # Split mode emulates a second input, so needs a single channel
+        self.buttons[SPLIT_BTN].disabled = self.channels * self.streams > 1
+
+        # The indicators have their own grid so it can scale to any number
+        self.panel = GridingManager()
+        self.indicators = [Indicator(label=label) for label in self.input_labels()]
 
-        ind_1 = self.box.grid(Indicator(label=CONFIG.get('source_1_label', '1'), row_span=2), 1, 0)
-        ind_2 = self.box.grid(Indicator(label=CONFIG.get('source_1_label', '2'), row_span=2), 2, 0)
-        self.indicators = [ind_1, ind_2]
+        self.graph = self.box.grid(Graph(row_span=2, col_span=2, inputs=self.inputs), 1, 2)
+        self.vu_p = self.box.grid(VUMeter(row_span=4, inputs=self.inputs), 3, 0)
 
-        self.graph = self.box.grid(Graph(row_span=2, col_span=2), 1, 2)
-        self.vu_p = self.box.grid(VUMeter(row_span=4), 3, 0)
+        # The statistics take the graph's place when shown
+        self.perf = PerfPane(row_span=2, col_span=2, xruns=self.xruns)
+        self.show_perf = CONFIG.perf_overlay
+        self.root.keys[pygame.K_p] = self.on_perf_toggle
 
         self.root.add_child(self.box)
 
-        if CONFIG['welcome_message']:
-            self.root.add_child(MessageBox(CONFIG['welcome_message']))
-        if NEW_CONFIG:
+        if CONFIG.welcome_message:
+            self.root.add_child(MessageBox(CONFIG.welcome_message))
+        if CONFIG.created:
             self.root.add_child(MessageBox(CONFIG_MESSAGE))
 
         self.reflow()
 
+    def input_labels(self):
+        """Get the label for each input, numbering channels if there are several"""
+        labels = list(CONFIG.channel_labels)
+        sources = [CONFIG.source_1_label, CONFIG.source_2_label]
+        for index in range(len(labels), self.inputs):
+            stream, channel = divmod(index, self.channels)
+            if self.channels == 1:
+                labels.append(sources[stream % 2])
+            else:
+                labels.append('%s %d' % (sources[stream % 2], channel + 1))
+        return labels
+
+    def set_modes(self):
+        """Tell the worker processes which filters are enabled"""
+        if self.pool is not None:
+            self.pool.set_modes(self.buttons[AW_BTN].state, self.buttons[SPLIT_BTN].state)
+
     # Callbacks
+    def on_aw_tog_click(self, _, __):
+        """Callback handler for the A-weighting toggle"""
+        self.set_modes()
+
     def on_speech_tog_click(self, _, state):
         """Callback handler for the speech toggle"""
         if state:  # Enable speech mode
-            self.vu_p.loud = CONFIG.get('loud_speech', 12)
-            self.vu_p.quiet = CONFIG.get('quiet_speech', 30)
+            self.vu_p.loud = CONFIG.loud_speech
+            self.vu_p.quiet = CONFIG.quiet_speech
 
-            self.loud = CONFIG.get('loud_speech', 12)
-            self.quiet = CONFIG.get('quiet_speech', 30)
+            self.loud = CONFIG.loud_speech
+            self.quiet = CONFIG.quiet_speech
         else:  # Disable speech mode
-            self.vu_p.loud = CONFIG.get('loud_music', 3)
-            self.vu_p.quiet = CONFIG.get('quiet_music', 15)
+            self.vu_p.loud = CONFIG.loud_music
+            self.vu_p.quiet = CONFIG.quiet_music
 
-            self.loud = CONFIG.get('loud_music', 3)
-            self.quiet = CONFIG.get('quiet_music', 15)
+            self.loud = CONFIG.loud_music
+            self.quiet = CONFIG.quiet_music
 
     def on_graph_tog_click(self, _, __):
         """Callback handler for the graph toggle"""
@@ -154,6 +267,18 @@ class Meter:
 
     def on_split_tog_click(self, _, __):
         """Callback handler for the split toggle"""
+        self.set_modes()
+        self.reflow()
+
+    def on_config_reload(self):
+        """Pick up the thresholds and labels from a reloaded config"""
+        self.on_speech_tog_click(None, self.buttons[SPEECH_BTN].state)
+        for indicator, label in zip(self.indicators, self.input_labels()):
+            indicator.label = label
+
+    def on_perf_toggle(self):
+        """Key handler to show or hide the performance statistics"""
+        self.show_perf = not self.show_perf
         self.reflow()
 
     def reflow(self):
@@ -161,136 +286,232 @@ class Meter:
         Remove all the center panes from the gridding manager and then re-grid
         them depending on what the user wants to be shown.
 
-        TODO: Find a cleaner way to do this.
+        The indicators are arranged in whichever grid keeps them closest to
+        square in the space that is left.
         """
 
-        self.box.remove(self.indicators[0])
-        self.box.remove(self.indicators[1])
+        self.box.remove(self.panel)
         self.box.remove(self.graph)
-        if CONFIG.get('line_in') or self.buttons[SPLIT_BTN].state:
-            self.indicators[0].row_span = 2
-            self.indicators[1].row_span = 2
-            if self.buttons[GRAPH_BTN].state:
-                self.indicators[0].col_span = 1
-                self.indicators[1].col_span = 1
-                self.box.grid(self.indicators[0], 1, 0)
-                self.box.grid(self.indicators[1], 2, 0)
-
-                self.graph.row_span = 2
-                self.graph.col_span = 2
-                self.box.grid(self.graph, 1, 2)
-            else:
-                self.indicators[0].col_span = 2
-                self.indicators[1].col_span = 2
-                self.box.grid(self.indicators[0], 1, 0)
-                self.box.grid(self.indicators[1], 1, 2)
-        else:
-            self.indicators[0].col_span = 2
-            self.box.grid(self.indicators[0], 1, 0)
-            if self.buttons[GRAPH_BTN].state:
-                self.indicators[0].row_span = 2
-                self.graph.row_span = 2
-                self.graph.col_span = 2
-
-                self.box.grid(self.graph, 1, 2)
-            else:
-                self.indicators[0].row_span = 4
+        self.box.remove(self.perf)
+        self.panel.clear()
 
-    # Audio processing
-    @staticmethod
-    def butter_pass_filter(data, cutoff, fs, btype, order=5):
-        """Perform a butter pass filter on a set of data"""
-        normal_cutoff = cutoff / (0.5 * fs)
-        b, a, *_ = scipy.signal.butter(order, normal_cutoff, btype=btype, analog=False)
-        return scipy.signal.lfilter(b, a, data)
+        shown = 1 if self.channels * self.streams == 1 and not self.buttons[SPLIT_BTN].state else self.inputs
+        graph = self.buttons[GRAPH_BTN].state or self.show_perf
 
-    B, A = a_weighting(CONFIG.get('rate', 44100))
+        self.panel.col_span = 2
+        self.panel.row_span = 2 if graph else 4
+        self.box.grid(self.panel, 1, 0)
+        if self.show_perf:
+            self.box.grid(self.perf, 1, 2)
+        elif graph:
+            self.box.grid(self.graph, 1, 2)
 
-    # Stream handling
-    @staticmethod
-    def rms(shorts):
-        """Calculate the root mean squared of a set of data"""
-        count = len(shorts)
-        sum_squares = 0
-        for sample in shorts:
-            n = sample * (1 / 32768)
-            sum_squares += n * n
-        return math.sqrt(sum_squares / count)
-
-    def get_db(self, data):
-        """Vaguely calculate the -dB from a sample"""
-        db = self.rms(data)
-        db = 20 * math.log10(db) if db else 48
-        return max(0, min(48, abs(db)))
-
-    def read(self, stream):
-        """Read data from a given PyAudio stream and then handle it as needed"""
-        data = stream.read(CONFIG.get('chunk', 1024), exception_on_overflow=False)
-
-        if self.buttons[AW_BTN].state:
-            # Apply A-weighting
-            data = np.frombuffer(data, dtype=np.int16)
-            data = scipy.signal.lfilter(self.B, self.A, data, axis=0)
-            db = self.get_db(data)
-        else:
-            count = len(data) / 2
-            shorts = struct.unpack(str(int(count)) + 'h', data)
-            db = self.get_db(shorts)
-            if self.buttons[SPLIT_BTN].state:
-                # The butter filter requests a numpy array
-                data = np.fromstring(data, dtype=np.int16)
+        # Work in pixels as the cells of the main grid are rarely square
+        width = self.screen.get_width() / 4 * self.panel.col_span
+        height = self.screen.get_height() / 4 * self.panel.row_span
 
-        return db, data
+        def squareness(columns):
+            rows = -(-shown // columns)
+            ratio = (width / columns) / (height / rows)
+            return max(ratio, 1 / ratio)
 
-    def add_value(self, val, index):
-        """Take a new packet of data and inform the other panes of it"""
-        self.graph.feed(index, val)  # Update graph
+        columns = min(range(1, shown + 1), key=squareness)
+        for i in range(shown):
+            self.panel.grid(self.indicators[i], i % columns, i // columns)
 
-        avg = min(self.graph.data_sets[index][-CONFIG.get('average_samples', 20):])
+        self.root.redraw()
 
-        state = LOW if avg >= self.quiet else HIGH if avg <= self.loud else MID
-        if self.indicators[index].state != state:  # Avoid unneeded re-drawing
-            self.indicators[index].state = state
-            self.indicators[index].dirty = True
-
-        self.vu_p.curr[index] = val
-        self.vu_p.avg[index] = avg
-        self.vu_p.dirty = True
-
-    def read_stream1(self):
-        """Stream handler for the primary stream"""
-        while self.root.running:
-            v, d = self.read(self.stream1)
+    # Stream handling
+    def reset_dsp(self, index):
+        """Forget a stream's filter, hop, peak, band and average state, as it came from another mode"""
+        self.filters.reset(index)
+        self.hopper.reset(index)
+        self.peaks.reset(index)
+        self.bands.reset(index)
+        if self.averager is not None:
+            self.averager.reset(index)
+            self.averager.reset(('split', index))
+
+    def read(self, data, index):
+        """
+        Handle a chunk of interleaved samples from one of the streams, in the
+        modes shown by the buttons as it arrived. All of its channels are
+        filtered together, then cut into hops. Returns the
+        frames of the hops that ended in this chunk, the mean square of each
+        channel over their windows, how many frames before the end of the
+        chunk they ended and their sample and true peaks as -dB, as a
+        `(hops, channels, 2)` array.
+        """
+        modes = (self.buttons[AW_BTN].state, self.buttons[SPLIT_BTN].state)
+        if modes != self.modes[index]:
+            self.modes[index] = modes
+            self.reset_dsp(index)
+
+        frames = dsp.deinterleave(data, self.channels)
+        # Peaks are of the signal as captured, as that is what clips
+        peaks = dsp.peak_to_db(self.peaks.apply(index, frames))
+        if modes[0]:
+            # Apply A-weighting
+            frames = self.filters.apply('a', index, frames)
 
-            if self.buttons[SPLIT_BTN].state:
-                # Split the packet into two chunks (defined in config)
-                split_frequency = CONFIG.get('split_frequency', 125)
-                rate = CONFIG.get('rate', 44100)
-                lp_data = self.butter_pass_filter(d, split_frequency, rate, 'low')
-                hp_data = self.butter_pass_filter(d, split_frequency, rate, 'high')
+        return self.hopper.apply(index, frames) + (peaks, )
 
-                lp_db = self.get_db(lp_data)
-                hp_db = self.get_db(hp_data)
+    def add_value(self, val, index, captured=None, avg=None, peaks=None):
+        """
+        Publish a new level for an input. `captured` is when the chunk it came
+        from was captured, if known, `avg` is its time-weighted level if
+        one is being calculated and `peaks` is its sample and true peak if
+        known. This is called from the stream threads, so the panes are left
+        alone until `update` runs on the main thread.
+        """
+        if not self.started:
+            self.started = True
+            self.mark('first_level')
 
-                self.add_value(lp_db, 1)
-                self.add_value(hp_db, 0)
-            else:
-                self.add_value(v, 0)
+        if avg is None:
+            avg = self.averages[index].push(val)
+        state = LOW if avg >= self.quiet else HIGH if avg <= self.loud else MID
+        peak, true_peak = (val, val) if peaks is None else peaks
+        held = self.holds[index].push(true_peak)
+
+        # The graph's levels are dropped if they aren't being drawn
+        self.graph_levels[index].write((val, ))
+        self.readings[index] = Reading(val, avg, state, captured, peak, true_peak, held)
+
+        if self.level_log is not None and captured is not None:
+            self.level_log.add(captured, index, val)
+
+    def update(self):
+        """Give the panes the newest reading of every input, on the main thread before each frame"""
+        for index, reading in enumerate(self.readings):
+            if reading is None or reading is self.shown[index]:
+                continue
+            self.shown[index] = reading
+
+            levels = self.graph_levels[index]
+            if levels.available:
+                self.graph.feed(index, levels.read(levels.available))
+                self.graph.captured = reading.captured
+
+            indicator = self.indicators[index]
+            if indicator.state != reading.state:  # Avoid unneeded re-drawing
+                indicator.state = reading.state
+                indicator.captured = reading.captured
+                indicator.dirty = True
+
+            self.vu_p.curr[index] = reading.level
+            self.vu_p.avg[index] = reading.average
+            self.vu_p.peak[index] = reading.peak
+            self.vu_p.true_peak[index] = reading.true_peak
+            self.vu_p.held[index] = reading.held
+            self.vu_p.captured = reading.captured
+            self.vu_p.dirty = True
+
+    def read_stream(self, index):
+        """Stream handler for one of the input devices"""
+        source = self.sources[index]
+        first = index * self.channels  # The first input fed by this stream
 
-            if not (CONFIG.get('line_in') or self.buttons[SPLIT_BTN].state):
-                # Flat-line the secondary input when not in use
-                self.add_value(48, 1)
+        while self.root.running:
+            for data in source.read():
+                captured = source.stamps.popleft()
+                d, power, late, peaks = self.read(data, index)
+                if not len(d):
+                    continue
+                # When the last sample of each hop was captured
+                stamps = (captured - late / CONFIG.rate).tolist()
+
+                if self.modes[index][1]:
+                    # Split the packet into the bands below and above the
+                    # frequency defined in config
+                    power = self.bands.apply(index, d[:, :1], self.hop)[:, 0]
+                    avgs = [(None, None)] * len(stamps)
+                    if self.averager is not None:
+                        avgs = self.averager.apply_power(('split', index), power, self.hop).tolist()
+                    STATS.stage('read', captured)
+
+                    # Both bands show the peaks of the whole signal
+                    dbs = dsp.power_to_db(power).tolist()
+                    peaks = peaks[:, 0].tolist()
+                    for stamp, (low, high), (low_avg, high_avg), peak in zip(stamps, dbs, avgs, peaks):
+                        self.add_value(low, 1, stamp, low_avg, peak)
+                        self.add_value(high, 0, stamp, high_avg, peak)
+                else:
+                    avgs = [[None] * self.channels] * len(stamps)
+                    if self.averager is not None:
+                        avgs = self.averager.apply(index, d, self.hop).tolist()
+                    STATS.stage('read', captured)
+
+                    hops = zip(stamps, dsp.power_to_db(power).tolist(), avgs, peaks.tolist())
+                    for stamp, dbs, hop_avgs, hop_peaks in hops:
+                        for channel, db in enumerate(dbs):
+                            self.add_value(db, first + channel, stamp, hop_avgs[channel], hop_peaks[channel])
+
+                        if self.channels * self.streams == 1:
+                            # Flat-line the secondary input when not in use
+                            self.add_value(48, 1, stamp)
+                STATS.stage('add_value', captured)
+                self.root.notify()
+
+    def read_results(self, index):
+        """Results handler for a stream whose DSP is done by the worker processes"""
+        first = index * self.channels
 
-    def read_stream2(self):
-        """Stream handler for the secondary stream"""
         while self.root.running:
-            v, _ = self.read(self.stream2)
-            self.add_value(v, 1)
+            for lo, captured, split, levels, avgs, peaks, true_peaks in self.pool.read(index):
+                STATS.stage('read', captured)
+                avgs = [None] * len(levels) if avgs is None else avgs.tolist()
+                peaks = list(zip(peaks.tolist(), true_peaks.tolist()))
+                if split:
+                    self.add_value(float(levels[1]), 1, captured, avgs[1], peaks[1])
+                    self.add_value(float(levels[0]), 0, captured, avgs[0], peaks[0])
+                else:
+                    for channel, db in enumerate(levels.tolist()):
+                        self.add_value(db, first + lo + channel, captured, avgs[channel], peaks[channel])
+
+                    if self.channels * self.streams == 1:
+                        self.add_value(48, 1, captured)
+                STATS.stage('add_value', captured)
+                self.root.notify()
+
+    def xruns(self):
+        """The total number of xruns and dropped samples across the inputs"""
+        total = sum(source.xruns + source.dropped for source in self.sources)
+        if self.pool is not None:
+            total += self.pool.dropped
+        return total
+
+    def log_perf(self):
+        """Periodically append the performance statistics to the log file"""
+        while self.root.running:
+            time.sleep(CONFIG.perf_log_interval)
+            STATS.dump(CONFIG.perf_log)
+
+    def close(self):
+        """
+        Stop the stream threads and then the worker processes and inputs, and
+        flush the level log. PortAudio could otherwise still be calling back
+        into Python as the interpreter shuts down.
+        """
+        if self.root is not None:
+            self.root.running = False
+        for thread in self.threads:
+            thread.join(1)
+
+        if self.pool is not None:
+            self.pool.close()
+        for source in self.sources:
+            source.close()
+        if self.audio is not None:
+            self.audio.terminate()
+        if self.level_log is not None:
+            self.level_log.close()
 
     # Mainloop
     def main(self):
         """Hand over to the GUI manager"""
         self.root.mainloop()
+        self.close()
         pygame.display.quit()
         pygame.font.quit()
 
@@ -0,0 +1,212 @@
+"""
+Offline analysis of recordings.
+
+A WAV file is memory-mapped and run through the same filters and level
+calculations as the live meter, but in large blocks and without a display,
+so it runs much faster than real time. The per-chunk levels, averages and
+LOW/MID/HIGH states that `Meter.add_value` would have produced are written
+out as CSV.
+"""
+import argparse
+import csv
+import struct
+import sys
+
+import numpy as np
+
+from .config import CONFIG
+from . import dsp
+from .enums import *
+
+
+STATE_NAMES = {LOW: 'LOW', MID: 'MID', HIGH: 'HIGH'}
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def map_wav(filename):
+    """
+    Memory-map the samples of a 16-bit PCM WAV file. Returns the sampling rate
+    and an array of shape `(frames, channels)`.
+    """
+    with open(filename, 'rb') as file_:
+        riff, _, form = struct.unpack('<4sI4s', file_.read(12))
+        if riff != b'RIFF' or form != b'WAVE':
+            raise ValueError('%s is not a WAV file' % filename)
+
+        fmt = None
+        while True:
+            header = file_.read(8)
+            if len(header) < 8:
+                raise ValueError('%s has no data chunk' % filename)
+            chunk_id, size = struct.unpack('<4sI', header)
+
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', file_.read(16))
+                file_.seek(size - 16 + size % 2, 1)
+            elif chunk_id == b'data':
+                offset = file_.tell()
+                break
+            else:
+                # Chunks are padded to an even length
+                file_.seek(size + size % 2, 1)
+
+    if fmt is None:
+        raise ValueError('%s has no format chunk' % filename)
+    tag, channels, rate, _, _, bits = fmt
+    if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or bits != 16:
+        raise ValueError('Only 16-bit PCM WAV files are supported')
+
+    frames = size // (2 * channels)
+    samples = np.memmap(filename, dtype='<i2', mode='r', offset=offset, shape=(frames, channels))
+    return rate, samples
+
+
+class Analyser:
+    """
+    Turns blocks of samples into the values the live meter would have shown.
+    Filter state and the averaging window are carried between blocks, so the
+    output does not depend on the block size.
+
+    `bands` can be `'octave'` or `'third'` to also measure the level of every
+    octave or third-octave band. A level is produced every `chunk` samples,
+    measured over the last `window` samples, which defaults to the chunk.
+    """
+
+    def __init__(self, rate, chunk, a_weighting=False, split=False, speech=False, bands=None, window=None):
+        self.chunk = chunk
+        self.a_weighting = a_weighting
+        self.split = split
+
+        self.filters = dsp.FilterChain(rate)
+        self.hopper = dsp.Hopper(chunk, window or CONFIG.window)
+        size = CONFIG.band_fft_size
+        self.split_bands = dsp.BandAnalyser(rate, size, dsp.split_bands(rate, CONFIG.split_frequency))
+        self.bands = None
+        if bands:
+            self.bands = dsp.BandAnalyser(rate, size, dsp.octave_bands(rate, 3 if bands == 'third' else 1))
+        self.window = CONFIG.average_samples
+        self.averager = None
+        if CONFIG.average != 'min':
+            self.averager = dsp.Averager(CONFIG.average, rate, CONFIG.leq_window)
+        if speech:
+            self.loud, self.quiet = CONFIG.loud_speech, CONFIG.quiet_speech
+        else:
+            self.loud, self.quiet = CONFIG.loud_music, CONFIG.quiet_music
+
+        inputs = 2 if split else 1
+        # The values still inside the averaging window from the last block
+        self._history = [np.full(self.window - 1, np.inf) for _ in range(inputs)]
+
+    def _average(self, index, dbs):
+        """Apply the rolling minimum used by `Meter.add_value` to a block"""
+        values = np.concatenate((self._history[index], dbs))
+        self._history[index] = values[len(values) - (self.window - 1):]
+        return np.lib.stride_tricks.sliding_window_view(values, self.window).min(axis=1)
+
+    def _state(self, avg):
+        return np.where(avg >= self.quiet, LOW, np.where(avg <= self.loud, HIGH, MID))
+
+    def process(self, samples):
+        """
+        Analyse a block of samples, which should be a whole number of chunks
+        long. Returns a list with a `(db, avg, state)` tuple of arrays for
+        each input, in the same order as `Meter.add_value`'s indices, and the
+        band levels as a `(chunks, bands)` array if they were asked for.
+        """
+        data = samples
+        if self.a_weighting:
+            data = self.filters.apply('a', 0, data)
+        data, power, _ = self.hopper.apply(0, data)
+
+        if self.split:
+            # The high band is shown first
+            power = self.split_bands.apply(0, data, self.chunk)[:, ::-1]
+            dbs = dsp.power_to_db(power).T
+            avgs = None
+            if self.averager is not None:
+                avgs = self.averager.apply_power('split', power, self.chunk).T
+        else:
+            dbs = [dsp.power_to_db(power)]
+            avgs = None
+            if self.averager is not None:
+                avgs = [self.averager.apply(0, data, self.chunk)]
+
+        results = []
+        for index, db in enumerate(dbs):
+            avg = self._average(index, db) if avgs is None else avgs[index]
+            results.append((db, avg, self._state(avg)))
+
+        bands = None
+        if self.bands is not None:
+            bands = dsp.power_to_db(self.bands.apply(0, data, self.chunk))
+        return results, bands
+
+
+def analyse(filename, output, chunk=None, channel=0, block_chunks=1024, **kwargs):
+    """Analyse a WAV file, writing one CSV row per chunk. Returns the chunk count."""
+    chunk = chunk or CONFIG.hop or CONFIG.chunk
+    rate, samples = map_wav(filename)
+    analyser = Analyser(rate, chunk, **kwargs)
+
+    if analyser.split:
+        labels = [CONFIG.s1_split_label, CONFIG.s2_split_label]
+    else:
+        labels = [CONFIG.source_1_label]
+
+    writer = csv.writer(output)
+    header = ['time']
+    for label in labels:
+        header += [label + '_db', label + '_avg', label + '_state']
+    if analyser.bands is not None:
+        # Bands are named after their nominal centre frequency
+        centres = [(lower * upper) ** 0.5 for lower, upper in analyser.bands.bands]
+        header += ['%gHz' % dsp.nominal_frequency(centre) for centre in centres]
+    writer.writerow(header)
+
+    block = chunk * block_chunks
+    count = 0
+    for start in range(0, len(samples) // chunk * chunk, block):
+        results, bands = analyser.process(samples[start:start + block, channel])
+
+        times = (count + np.arange(len(results[0][0])) + 1) * chunk / rate
+        columns = [np.round(times, 4)]
+        for dbs, avg, states in results:
+            columns += [np.round(dbs, 2), np.round(avg, 2), [STATE_NAMES[state] for state in states]]
+        if bands is not None:
+            columns += list(np.round(bands, 2).T)
+        writer.writerows(zip(*columns))
+
+        count += len(times)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Produce the level history of a recording.')
+    parser.add_argument('file', help='a 16-bit PCM WAV file')
+    parser.add_argument('-o', '--output', help='where to write the CSV [stdout]')
+    parser.add_argument('--chunk', type=int, help='the number of samples between levels [from config]')
+    parser.add_argument('--window', type=int, help='the samples each level is measured over [from config]')
+    parser.add_argument('--channel', type=int, default=0, help='the channel of the file to analyse')
+    parser.add_argument('--aw', action='store_true', help='enable A-weighting')
+    parser.add_argument('--split', action='store_true', help='enable split mode')
+    parser.add_argument('--speech', action='store_true', help='use the speech thresholds')
+    parser.add_argument('--bands', choices=['octave', 'third'], help='also output octave or third-octave band levels')
+    args = parser.parse_args(argv)
+
+    try:
+        _, samples = map_wav(args.file)
+    except ValueError as e:
+        parser.error(e)
+    channels = samples.shape[1]
+    if not 0 <= args.channel < channels:
+        parser.error('--channel must be from 0 to %d, as %s has %d channel(s)' % (channels - 1, args.file, channels))
+
+    kwargs = dict(chunk=args.chunk, channel=args.channel, a_weighting=args.aw, split=args.split,
+                  speech=args.speech, bands=args.bands, window=args.window)
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            analyse(args.file, output, **kwargs)
+    else:
+        analyse(args.file, sys.stdout, **kwargs)
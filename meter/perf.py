@@ -0,0 +1,133 @@
+"""
+Latency and timing statistics for the whole pipeline.
+
+Every chunk is stamped with `time.perf_counter()` when it is captured, and the
+stamp travels with the chunk's levels. Each stage records how long after
+capture it handled the chunk:
+
+- `read`: the levels have been calculated
+- `add_value`: the levels have been published for the panes
+- `render`: a pane showing the levels has been re-drawn
+- `display`: the re-drawn area has been pushed to the screen
+
+Recording a value is a single store into a preallocated array, so it is
+cheap enough to leave running all the time.
+
+Start-up is timed separately, as the time from the package being imported
+until each of the `STARTUP` steps finished:
+
+- `imports`: every module the meter needs has been loaded
+- `display`: the interface has been drawn for the first time
+- `audio`: the inputs have been opened and are being read
+- `dsp`: SciPy has been loaded and the filters designed, in the background
+- `first_level`: the first level has been published for the panes
+"""
+import time
+
+import numpy as np
+
+from . import STARTED
+from .buffers import History
+
+STAGES = ('read', 'add_value', 'render', 'display')
+STARTUP = ('imports', 'display', 'audio', 'dsp', 'first_level')
+
+
+class Histogram:
+    """
+    The last `length` durations, summarised as percentiles. Values are
+    recorded in seconds but reported in milliseconds.
+    """
+
+    def __init__(self, length=512):
+        self._values = History(length)
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, seconds):
+        self._values.append(seconds * 1000)
+
+    def percentiles(self, *percentiles):
+        """Return the given percentiles in milliseconds, or NaN if empty."""
+        values = self._values.values()
+        if not len(values):
+            return [float('nan')] * len(percentiles)
+        return np.percentile(values, percentiles).tolist()
+
+
+class Stats:
+    """The statistics collected from every stage of the meter."""
+
+    def __init__(self, length=512):
+        self.length = length
+        self.stages = {stage: Histogram(length) for stage in STAGES}
+        self.panes = {}
+        self.frames = Histogram(length)
+
+        self.startup = {}
+
+        self._last_frame = None
+        self._shown = None
+
+    def stage(self, stage, captured):
+        """Record that `stage` has handled a chunk captured at `captured`."""
+        self.stages[stage].add(time.perf_counter() - captured)
+
+    def pane(self, name, seconds):
+        """Record how long a pane took to render."""
+        if name not in self.panes:
+            self.panes[name] = Histogram(self.length)
+        self.panes[name].add(seconds)
+
+    def rendered(self, captured):
+        """Note a chunk drawn this frame, so `displayed` can time it."""
+        self.stage('render', captured)
+        if self._shown is None or captured > self._shown:
+            self._shown = captured
+
+    def displayed(self):
+        """Called once per frame after the screen has been updated."""
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            self.frames.add(now - self._last_frame)
+        self._last_frame = now
+
+        if self._shown is not None:
+            self.stages['display'].add(now - self._shown)
+            self._shown = None
+
+    def mark(self, step):
+        """
+        Record that a step of starting up has finished. Returns whether that
+        was the last of the `STARTUP` steps to finish.
+        """
+        if step in self.startup:
+            return False
+        self.startup[step] = time.perf_counter() - STARTED
+        return all(step in self.startup for step in STARTUP)
+
+    def startup_summary(self):
+        """Return a single line giving when each step of starting up finished."""
+        steps = sorted(self.startup.items(), key=lambda item: item[1])
+        return 'startup ' + ' '.join('%s=%.3fs' % step for step in steps)
+
+    @property
+    def fps(self):
+        interval = self.frames.percentiles(50)[0]
+        return 1000 / interval if interval > 0 else 0
+
+    def summary(self):
+        """Return a single line describing the recent statistics."""
+        parts = ['%.3f' % time.time(), 'fps=%.1f' % self.fps]
+        for name, histogram in list(self.stages.items()) + sorted(self.panes.items()):
+            parts.append('%s=%.2f/%.2f/%.2f' % ((name, ) + tuple(histogram.percentiles(50, 95, 99))))
+        return ' '.join(parts)
+
+    def dump(self, filename):
+        """Append `summary` to a log file."""
+        with open(filename, 'a') as log:
+            log.write(self.summary() + '\n')
+
+
+STATS = Stats()
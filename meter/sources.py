@@ -0,0 +1,156 @@
+import collections
+import time
+import wave
+
+import numpy as np
+
+from .dsp import FULL_SCALE
+
+
+class SyntheticSource:
+    """
+    Stands in for one of the capture classes in `meter.capture`, playing a
+    pre-generated table of audio on a loop instead of recording it.
+
+    With `realtime` set, chunks are handed out at the rate they would arrive
+    from a sound card, several at a time if the reader has fallen behind.
+    Otherwise they are produced as fast as they can be consumed. The time at
+    which each chunk was "captured" is appended to `.stamps`.
+
+    With more than one channel, the audio is interleaved across them with
+    each channel 3dB quieter than the one before.
+    """
+
+    def __init__(self, chunk, rate=44100, realtime=True, channels=1):
+        self.chunk = chunk
+        self.rate = rate
+        self.realtime = realtime
+        self.channels = channels
+
+        self.dropped = 0
+        self.xruns = 0
+        self.stamps = collections.deque()
+
+        self._table = None
+        self._length = 0
+        self._position = 0
+        self._start = None
+
+    def generate(self, rate):
+        """
+        Return the table of samples (scaled to +/-1) to be looped. This is
+        either mono or already shaped as `(frames, channels)`.
+        """
+        raise NotImplementedError
+
+    def _next_chunk(self):
+        if self._table is None:
+            table = self.generate(self.rate)
+            if table.ndim == 1:
+                table = table[:, None] * 10 ** (-3 * np.arange(self.channels) / 20)
+            table = np.clip(table * FULL_SCALE, -FULL_SCALE, FULL_SCALE - 1)
+
+            self._length = len(table)
+            # Repeat the table so a chunk can always be sliced in one go
+            repeats = -(-(self._length + self.chunk) // self._length)
+            self._table = np.tile(table.astype(np.int16), (repeats, 1))
+
+        start = self._position % self._length
+        self._position += self.chunk
+        return self._table[start:start + self.chunk].ravel()
+
+    def read(self):
+        """Return the list of chunks which are due, waiting if none are"""
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+
+        if not self.realtime:
+            self.stamps.append(now)
+            return [self._next_chunk()]
+
+        due = int((now - self._start) * self.rate) // self.chunk - self._position // self.chunk
+        if due < 1:
+            time.sleep(self._start + (self._position + self.chunk) / self.rate - now)
+            due = 1
+
+        chunks = []
+        for _ in range(due):
+            chunks.append(self._next_chunk())
+            self.stamps.append(self._start + self._position / self.rate)
+        return chunks
+
+    def close(self):
+        pass
+
+
+class SineSource(SyntheticSource):
+    """A pure tone at a fixed level"""
+
+    def __init__(self, chunk, rate=44100, realtime=True, channels=1, frequency=1000, level=-12):
+        super().__init__(chunk, rate, realtime, channels)
+        self.frequency = frequency
+        self.level = level
+
+    def generate(self, rate):
+        # One second of a whole number of cycles loops seamlessly
+        t = np.arange(rate) / rate
+        return np.sin(2 * np.pi * round(self.frequency) * t) * 10 ** (self.level / 20)
+
+
+class PinkNoiseSource(SyntheticSource):
+    """Pink (1/f) noise at a given RMS level"""
+
+    def __init__(self, chunk, rate=44100, realtime=True, channels=1, level=-20, seconds=10):
+        super().__init__(chunk, rate, realtime, channels)
+        self.level = level
+        self.seconds = seconds
+
+    def generate(self, rate):
+        # Shape white noise in the frequency domain rather than with a filter
+        count = rate * self.seconds
+        spectrum = np.fft.rfft(np.random.default_rng(0).standard_normal(count))
+        spectrum[1:] /= np.sqrt(np.arange(1, len(spectrum)))
+        spectrum[0] = 0
+        noise = np.fft.irfft(spectrum, count)
+
+        return noise / np.sqrt(np.mean(noise ** 2)) * 10 ** (self.level / 20)
+
+
+class SteppedSource(SyntheticSource):
+    """A tone which steps through a list of levels, holding each for a while"""
+
+    def __init__(self, chunk, rate=44100, realtime=True, channels=1, levels=(-40, -30, -20, -10, -3), hold=1):
+        super().__init__(chunk, rate, realtime, channels)
+        self.levels = levels
+        self.hold = hold
+
+    def generate(self, rate):
+        t = np.arange(rate * self.hold) / rate
+        tone = np.sin(2 * np.pi * 1000 * t)
+        return np.concatenate([tone * 10 ** (level / 20) for level in self.levels])
+
+
+class WavSource(SyntheticSource):
+    """Loops a 16-bit PCM WAV file, keeping all of its channels"""
+
+    def __init__(self, chunk, filename, realtime=True):
+        with wave.open(filename) as file_:
+            if file_.getsampwidth() != 2:
+                raise ValueError('Only 16-bit WAV files are supported')
+            channels = file_.getnchannels()
+            self._frames = file_.readframes(file_.getnframes())
+            rate = file_.getframerate()
+
+        super().__init__(chunk, rate, realtime, channels)
+
+    def generate(self, rate):
+        samples = np.frombuffer(self._frames, dtype='<i2').reshape(-1, self.channels)
+        return samples / FULL_SCALE
+
+
+SOURCES = {
+    'sine': SineSource,
+    'pink': PinkNoiseSource,
+    'steps': SteppedSource,
+}
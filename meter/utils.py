@@ -1,3 +1,5 @@
+import collections
+
 import pygame
 
 import os
@@ -8,10 +10,21 @@ class Font:
     Provides a caching wrapper around pygame.font.Font.
     Usually speeds up rendering significantly by rendering once then just
     retrieving from RAM on future render calls.
+
+    The cache holds at most `capacity` surfaces, discarding the least recently
+    used, so labels which change constantly can't grow it forever. Numbers
+    which change every frame should instead be drawn using `blit_number`.
     """
-    def __init__(self, filename):
-        self._cache = {}
+    GLYPHS = '0123456789.-+ '
+
+    def __init__(self, filename, capacity=256):
+        self._cache = collections.OrderedDict()
         self._fonts = {}
+        self._glyphs = {}
+
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
 
         self.filename = os.path.join(os.path.dirname(__file__), filename)
 
@@ -24,16 +37,54 @@ class Font:
 
         return font
 
+    def _get_glyphs(self, colour, size):
+        """Render every character in `GLYPHS` once for a colour and size"""
+        if (colour, size) in self._glyphs:
+            return self._glyphs[colour, size]
+
+        font = self._get_font(size)
+        glyphs = {char: font.render(char, 1, colour) for char in self.GLYPHS}
+        self._glyphs[colour, size] = glyphs
+
+        return glyphs
+
     def render(self, text, colour, size):
         colour = tuple(colour)
+        key = (text, colour, size)
+
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        surface = self._get_font(size).render(text, 1, colour)
+        self._cache[key] = surface
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
 
-        if (text, colour, size) in self._cache:
-            return self._cache[text, colour, size]
+        return surface
+
+    def blit_number(self, surface, text, colour, size, position):
+        """
+        Draw a short numeric string straight onto a surface by blitting one
+        pre-rendered glyph per character. Anything not in `GLYPHS` falls back
+        to `render`. Returns the width that was drawn.
+        """
+        colour = tuple(colour)
+        if any(char not in self.GLYPHS for char in text):
+            rendered = self.render(text, colour, size)
+            surface.blit(rendered, position)
+            return rendered.get_width()
 
-        text = self._get_font(size).render(text, 1, colour)
-        self._cache[text, colour, size] = text
+        glyphs = self._get_glyphs(colour, size)
+        x, y = position
+        for char in text:
+            glyph = glyphs[char]
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
 
-        return text
+        return x - position[0]
 
     def get_ascent(self, size):
         return self._get_font(size).get_ascent()
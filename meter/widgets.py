@@ -1,11 +1,12 @@
 import pygame
 
-from .config import load_config
+from .config import CONFIG
 from .utils import Font
+from .buffers import History
 from .grid import Pane
+from .perf import STATS
 from .enums import *
 
-CONFIG, _ = load_config()
 FONT = Font('assets/font.ttf')
 
 
@@ -24,6 +25,7 @@ class Button(Pane):
     Setting `.disabled` to `True` will **not** set `.state` to `False`. The
     code disabling the button should be responsible for this.
     """
+    events = (pygame.MOUSEBUTTONDOWN, )
 
     def __init__(self, *args, **kwargs):
         super().__init__()
@@ -33,23 +35,27 @@ class Button(Pane):
         self.state = kwargs.get('state', False)
         self.callback = kwargs.get('callback', None)
 
-    def render(self):
-        palette = CONFIG['button_dgrey_colour'] if self.disabled else \
-            (CONFIG['button_blue_colour'] if self.state else CONFIG['button_grey_colour']) \
-                if self.text else CONFIG['button_colour']
+    def draw(self, surface):
+        """Draw the button as it appears in its current state"""
+        palette = CONFIG.button_dgrey_colour if self.disabled else \
+            (CONFIG.button_blue_colour if self.state else CONFIG.button_grey_colour) \
+                if self.text else CONFIG.button_colour
 
-        self.surface.fill(palette[0])
-        size = self.surface.get_size()
+        surface.fill(palette[0])
+        size = surface.get_size()
 
-        pygame.draw.line(self.surface, palette[1], (0, 0), (size[0], 0))
-        pygame.draw.line(self.surface, palette[2], (size[0] - 1, 0), (size[0] - 1, size[1]))
-        pygame.draw.line(self.surface, palette[2], (0, size[1] - 1), (size[0], size[1] - 1))
-        pygame.draw.line(self.surface, palette[3], (0, 0), (0, size[1]))
+        pygame.draw.line(surface, palette[1], (0, 0), (size[0], 0))
+        pygame.draw.line(surface, palette[2], (size[0] - 1, 0), (size[0] - 1, size[1]))
+        pygame.draw.line(surface, palette[2], (0, size[1] - 1), (size[0], size[1] - 1))
+        pygame.draw.line(surface, palette[3], (0, 0), (0, size[1]))
 
         if self.text:
-            t = FONT.render(self.text, CONFIG['fg_colour'], CONFIG['big_font_size'])
-            self.surface.blit(t, ((size[0] - t.get_width()) / 2,
-                                  (size[1] - t.get_height()) / 2))
+            t = FONT.render(self.text, CONFIG.fg_colour, CONFIG.big_font_size)
+            surface.blit(t, ((size[0] - t.get_width()) / 2,
+                             (size[1] - t.get_height()) / 2))
+
+    def render(self):
+        self.surface.blit(self.static_layer((self.disabled, self.state, self.text), self.draw), (0, 0))
 
     def event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -57,6 +63,7 @@ class Button(Pane):
                 return
 
             self.state = not self.state
+            self.dirty = True
             if self.callback is not None:
                 self.callback(event, self.state)
 
@@ -72,65 +79,128 @@ class Indicator(Pane):
         self.label = kwargs.get('label', '')
         self.state = MID
 
-    def render(self):
-        col = CONFIG['green'] if self.state == MID else CONFIG['orange'] if self.state == LOW else CONFIG['red']
-        self.outline_and_fill(CONFIG['bg_colour'], col)
+    def draw(self, surface):
+        """Draw the indicator as it appears in its current state"""
+        col = CONFIG.green if self.state == MID else CONFIG.orange if self.state == LOW else CONFIG.red
+        self.outline_and_fill(CONFIG.bg_colour, col, surface)
 
         if self.label:
-            t = FONT.render(self.label, CONFIG['fg_colour'], CONFIG['big_font_size'])
-            self.surface.blit(t, (CONFIG['colour_padding'] + 2, CONFIG['colour_padding']))
+            t = FONT.render(self.label, CONFIG.fg_colour, CONFIG.big_font_size)
+            surface.blit(t, (CONFIG.colour_padding + 2, CONFIG.colour_padding))
+
+    def render(self):
+        self.surface.blit(self.static_layer((self.state, self.label), self.draw), (0, 0))
 
 
 class Graph(Pane):
     """
     A basic graph without labels or axises. Data is fed in through `.feed` and
-    up to two sets of data can be plotted at once. No fitting is performed, so
-    data points are joined up using a direct straight line.
+    one set of data is plotted for each input (two by default). No fitting is
+    performed, so data points are joined up using a direct straight line.
+
+    When `graph_scroll` is enabled, the existing plot is scrolled left by the
+    number of new samples and only the new segments are drawn, so the cost of
+    a frame does not depend on how long the history is.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.data_sets = [[], []]
-
-    def feed(self, set_num, data):
-        self.data_sets[set_num].append(data)
-        while len(self.data_sets[set_num]) > CONFIG['graph_samples']:
-            self.data_sets[set_num] = self.data_sets[set_num][1:]
+        self.data_sets = [History(CONFIG.graph_samples) for _ in range(kwargs.get('inputs', 2))]
 
-    def render(self):
-        size = self.surface.get_size()
+        self._drawn = None  # The sample counts as of the last render
+        self._plot_size = None
 
-        self.outline_and_fill(CONFIG['bg_colour'], CONFIG['border_colour'])
+    def restyle(self):
+        super().restyle()
+        self._drawn = None
 
-        dx = (size[0] - CONFIG['colour_padding'] * 2) / CONFIG['graph_samples']
-        dy = (size[1] - CONFIG['colour_padding'] * 2) / 48
+    def feed(self, set_num, values):
+        """Add new values to the end of a line."""
+        self.data_sets[set_num].extend(values)
+        self.dirty = True
 
-        def plot_line(samples, colour):
-            if len(samples) > 1:
-                pygame.draw.lines(self.surface, colour, False, [
-                    (size[0] - x * dx - CONFIG['colour_padding'], y * dy + CONFIG['colour_padding'])
-                    for x, y in enumerate(samples[::-1])
+    def render(self):
+        size = self.surface.get_size()
+        pad = CONFIG.colour_padding
+        plot = self.surface.subsurface((pad, pad, size[0] - pad * 2, size[1] - pad * 2))
+
+        dx = plot.get_width() / CONFIG.graph_samples
+        dy = plot.get_height() / 48
+        right = plot.get_width() - 1
+
+        # Sample `i` always sits at `round(i * dx)` from an origin which
+        # follows the newest sample, so scrolling is by whole pixels and the
+        # incremental and full paths draw identical lines.
+        counts = [data_set.count for data_set in self.data_sets]
+        clock = max(counts)
+
+        def point(i, y):
+            return right - (round((clock - 1) * dx) - round(i * dx)), y * dy
+
+        new = clock - max(self._drawn) if self._drawn else None
+        shift = round((clock - 1) * dx) - round((clock - 1 - new) * dx) if new is not None else None
+
+        if (not CONFIG.graph_scroll or self._plot_size != size
+                or new is None or new > CONFIG.graph_samples or shift >= plot.get_width()):
+            # Redraw the whole plot
+            self.outline_and_fill(CONFIG.bg_colour, CONFIG.border_colour)
+            first = [count - CONFIG.graph_samples for count in counts]
+        else:
+            # Move the existing plot along and clear the strip that was exposed
+            if shift:
+                # The rounded corners from `outline_and_fill` must not be
+                # dragged along with the plot
+                bottom = plot.get_height() - 1
+                plot.set_at((right, 0), CONFIG.border_colour)
+                plot.set_at((right, bottom), CONFIG.border_colour)
+
+                plot.scroll(-shift, 0)
+                plot.fill(CONFIG.border_colour, (right - shift + 1, 0, shift, plot.get_height()))
+
+                for corner in ((0, 0), (right, 0), (0, bottom), (right, bottom)):
+                    plot.set_at(corner, CONFIG.bg_colour)
+            first = [drawn - 1 for drawn in self._drawn]
+
+        def plot_line(data_set, count, start, colour):
+            start = max(start, count - len(data_set), 0)
+            if count - start > 1:
+                # More samples may have arrived since `count` was read
+                samples = data_set.tail(data_set.count - start)[:count - start].tolist()
+                pygame.draw.lines(plot, colour, False, [
+                    point(start + x, y) for x, y in enumerate(samples)
                 ])
 
-        plot_line(self.data_sets[0], CONFIG['graph_colour'])
-        plot_line(self.data_sets[1], CONFIG['graph_colour_2'])
+        colours = (CONFIG.graph_colour, CONFIG.graph_colour_2)
+        for i, data_set in enumerate(self.data_sets):
+            plot_line(data_set, counts[i], first[i], colours[i % len(colours)])
+
+        self._drawn = counts
+        self._plot_size = size
 
 
 class VUMeter(Pane):
     """
-    A dual "VU" meter display. Data is fed in by setting `.avg` and `.curr`.
-    When only one bar is being used, the other just sits at -48. The average
-    is displayed using a horizontal cross bar.
+    A multi-bar "VU" meter display, with one bar per input (two by default).
+    Data is fed in by setting `.avg` and `.curr`. Bars that aren't being used
+    just sit at -48. The average is displayed using a horizontal cross bar.
+
+    The sample peak (`.peak`) is shown as a dimmer bar behind the level, with
+    a thin line at the true peak (`.true_peak`) and a thicker one at the held
+    peak (`.held`), which turns red once a peak reaches full scale.
     """
+    clip = 0.1  # Held peaks within this many dB of full scale are shown as clipped
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.avg = [48, 48]
-        self.curr = [48, 48]
+        self.avg = [48] * kwargs.get('inputs', 2)
+        self.curr = [48] * kwargs.get('inputs', 2)
+        self.peak = [48] * kwargs.get('inputs', 2)
+        self.true_peak = [48] * kwargs.get('inputs', 2)
+        self.held = [48] * kwargs.get('inputs', 2)
 
-        self.loud = CONFIG['loud_music']
-        self.quiet = CONFIG['quiet_music']
+        self.loud = CONFIG.loud_music
+        self.quiet = CONFIG.quiet_music
 
     @staticmethod
     def get_y(vu_height, vu):
@@ -156,9 +226,9 @@ class VUMeter(Pane):
 
             pygame.draw.rect(self.surface, colour, (xoff, yp + vu_y + 1, width, h))
 
-    def render(self):
+    def get_geometry(self):
+        """Calculate the width and height of half a bar and the area of the meter"""
         size = self.surface.get_size()
-        self.outline_and_fill(CONFIG['bg_darker'], None)
 
         half = size[0] // 4
         vu_width = half * 2 + 1
@@ -166,9 +236,18 @@ class VUMeter(Pane):
         vu_x = (size[0] - vu_width) / 2
         vu_y = (size[1] - vu_height) / 2
 
-        pygame.draw.line(self.surface, CONFIG['border_light'], (vu_x, vu_y + vu_height - 2),
+        return half, vu_width, vu_height, vu_x, vu_y
+
+    def draw_scale(self, surface):
+        """Draw everything that does not move: the scale, frame and watermark"""
+        size = surface.get_size()
+        self.outline_and_fill(CONFIG.bg_darker, None, surface)
+
+        half, vu_width, vu_height, vu_x, vu_y = self.get_geometry()
+
+        pygame.draw.line(surface, CONFIG.border_light, (vu_x, vu_y + vu_height - 2),
                          (vu_x + vu_width - 1, vu_y + vu_height - 2))
-        pygame.draw.line(self.surface, CONFIG['text_colour'], (vu_x + vu_width, vu_y),
+        pygame.draw.line(surface, CONFIG.text_colour, (vu_x + vu_width, vu_y),
                          (vu_x + vu_width, vu_y + vu_height - 3))
 
         # Draw the scale down the side
@@ -177,42 +256,105 @@ class VUMeter(Pane):
             y, _ = self.get_y(vu_height, vu)
             y += vu_y + 1
 
-            pygame.draw.line(self.surface, CONFIG['text_colour'],
+            pygame.draw.line(surface, CONFIG.text_colour,
                              (vu_x - 4, y), (vu_x + vu_width + 4, y))
 
-            t = FONT.render(str(vu), CONFIG['text_colour'], CONFIG['font_size'])
+            t = FONT.render(str(vu), CONFIG.text_colour, CONFIG.font_size)
             # Centre text using descent and ascent
-            yp = y - (FONT.get_ascent(CONFIG['font_size']) - FONT.get_descent(CONFIG['font_size'])) / 2
-            self.surface.blit(t, (vu_x + vu_width + 5, yp))
+            yp = y - (FONT.get_ascent(CONFIG.font_size) - FONT.get_descent(CONFIG.font_size)) / 2
+            surface.blit(t, (vu_x + vu_width + 5, yp))
 
-        pygame.draw.rect(self.surface, CONFIG['border_colour'], (vu_x, vu_y, vu_width, vu_height - 1))
+        pygame.draw.rect(surface, CONFIG.border_colour, (vu_x, vu_y, vu_width, vu_height - 1))
 
         # Draw the background for the bars
-        pygame.draw.rect(self.surface, CONFIG['dark_blue'], (vu_x + 1, vu_y + 1, vu_width - 2, vu_height - 3))
+        pygame.draw.rect(surface, CONFIG.dark_blue, (vu_x + 1, vu_y + 1, vu_width - 2, vu_height - 3))
+
+        # Render the watermark
+        if CONFIG.watermark:
+            watermark = FONT.render("https://bsnk.me/spl", CONFIG.text_colour, CONFIG.font_size)
+            surface.blit(watermark, (size[0] - watermark.get_width() - 2,
+                                     size[1] - watermark.get_height()))
+
+    def render(self):
+        self.surface.blit(self.static_layer(None, self.draw_scale), (0, 0))
+
+        _, vu_width, vu_height, vu_x, vu_y = self.get_geometry()
+        bar = (vu_width - 1) // len(self.curr)
 
         def draw_bar(vu, xoff, col, height=None, width=None):
             """Provides a helper class to scope some variables"""
-            w = half - 1 if width is None else width
+            w = bar - 1 if width is None else width
             xoff += vu_x + 1
             self.meter_bar(vu, xoff, w, vu_height, vu_y, col, height)
 
         # Draw the bars and indicator lines
-        draw_bar(self.curr[1], half, CONFIG['light_blue'])
-        draw_bar(self.curr[0], 0, CONFIG['light_blue'])
-        draw_bar(self.avg[1], half, CONFIG['red'], 2)
-        draw_bar(self.avg[0], 0, CONFIG['red'], 2)
+        for i in range(len(self.curr)):
+            draw_bar(self.peak[i], bar * i, CONFIG.peak_colour)
+            draw_bar(self.curr[i], bar * i, CONFIG.light_blue)
+            draw_bar(self.true_peak[i], bar * i, CONFIG.light_blue, 1)
+            draw_bar(self.held[i], bar * i, CONFIG.red if self.held[i] < self.clip else CONFIG.hold_colour, 2)
+        for i in range(len(self.avg)):
+            draw_bar(self.avg[i], bar * i, CONFIG.red, 2)
 
-        draw_bar(self.quiet, 0, CONFIG['text_colour'], 1, vu_width - 2)
-        draw_bar(self.loud, 0, CONFIG['text_colour'], 1, vu_width - 2)
+        draw_bar(self.quiet, 0, CONFIG.text_colour, 1, vu_width - 2)
+        draw_bar(self.loud, 0, CONFIG.text_colour, 1, vu_width - 2)
 
-        # Central divider
-        pygame.draw.rect(self.surface, CONFIG['border_colour'], (vu_x + half, vu_y + 1, 1, vu_height - 3))
+        # Dividers between the bars
+        for i in range(1, len(self.curr)):
+            pygame.draw.rect(self.surface, CONFIG.border_colour, (vu_x + bar * i, vu_y + 1, 1, vu_height - 3))
 
-        # Render the watermark
-        if CONFIG['watermark']:
-            watermark = FONT.render("https://bsnk.me/spl", CONFIG['text_colour'], CONFIG['font_size'])
-            self.surface.blit(watermark, (size[0] - watermark.get_width() - 2,
-                                          size[1] - watermark.get_height()))
+
+class PerfPane(Pane):
+    """
+    Shows the frame rate and xrun count, then the 50th and 95th percentile
+    latency of each stage in `meter.perf` and the time taken to render each
+    kind of pane, all in milliseconds. `xruns` should be a callable returning
+    the total number of xruns and dropped samples.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = kwargs.get('stats', STATS)
+        self.xruns = kwargs.get('xruns', lambda: 0)
+        self._shown = None
+
+    def rows(self):
+        """Get the label and value of every line to show"""
+        def percentiles(histogram):
+            return ' '.join('-' if value != value else '%.2f' % value for value in histogram.percentiles(50, 95))
+
+        rows = [('FPS', '%.1f' % self.stats.fps), ('XRUNS', str(self.xruns()))]
+        for name, histogram in list(self.stats.stages.items()) + sorted(self.stats.panes.items()):
+            rows.append((name.upper(), percentiles(histogram)))
+        return rows
+
+    def draw(self, surface, labels):
+        """Draw the background and the labels of each line"""
+        self.outline_and_fill(CONFIG.bg_colour, CONFIG.dark_blue, surface)
+
+        y = CONFIG.colour_padding
+        for label in labels:
+            surface.blit(FONT.render(label, CONFIG.message_fg, CONFIG.font_size), (CONFIG.colour_padding + 2, y))
+            y += FONT.get_height(CONFIG.font_size)
+
+    def render(self):
+        rows = self.rows()
+        labels = tuple(label for label, _ in rows)
+        self.surface.blit(self.static_layer(labels, lambda surface: self.draw(surface, labels)), (0, 0))
+
+        x = self.surface.get_width() // 2
+        y = CONFIG.colour_padding
+        for _, value in rows:
+            FONT.blit_number(self.surface, value, CONFIG.message_fg, CONFIG.font_size, (x, y))
+            y += FONT.get_height(CONFIG.font_size)
+
+    def tick(self):
+        # Drawing this pane changes the frame rate and render times it shows,
+        # so only the xruns and stages are compared or it would never settle
+        shown = self.rows()[1:2 + len(self.stats.stages)]
+        if shown != self._shown:
+            self._shown = shown
+            self.dirty = True
 
 
 class MessageBox(Pane):
@@ -221,38 +363,46 @@ class MessageBox(Pane):
     Best used as a direct child of root (auto-wrapped in a `SingleManager`),
     but theoretically could be gridded like any other pane.
     """
+    opaque = False
+    events = (pygame.MOUSEBUTTONDOWN, )
 
     def __init__(self, message, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.message = message
 
         lines = self.message.split('\n')
-        self.lines = list(zip([CONFIG['mid_font_size']] * len(lines), lines))
-        self.lines.append((CONFIG['font_size'], 'Tap anywhere to continue'))
-
-    def rounded_rect(self, x, y, w, h, col, r):
-        pygame.draw.circle(self.surface, col, (x + r, y + r), r)
-        pygame.draw.circle(self.surface, col, (w + x - r, y + r), r)
-        pygame.draw.circle(self.surface, col, (x + r, h + y - r), r)
-        pygame.draw.circle(self.surface, col, (w + x - r, h + y - r), r)
-        pygame.draw.rect(self.surface, col, (x, y + r, w, h - r * 2))
-        pygame.draw.rect(self.surface, col, (x + r, y, w - r * 2, r))
-        pygame.draw.rect(self.surface, col, (x + r, y + h - r, w - r * 2, r))
-
-    def render(self):
-        size = self.surface.get_size()
-        self.surface.fill((0, 0, 0, 0))
-
-        self.rounded_rect(20, 20, size[0] - 40, size[1] - 40, CONFIG['bg_colour'], 10)
-        self.rounded_rect(22, 22, size[0] - 44, size[1] - 44, CONFIG['bg_darker'], 8)
-        self.rounded_rect(24, 24, size[0] - 48, size[1] - 48, CONFIG['bg_colour'], 6)
+        self.lines = list(zip([CONFIG.mid_font_size] * len(lines), lines))
+        self.lines.append((CONFIG.font_size, 'Tap anywhere to continue'))
 
-        y = (size[1] - FONT.get_height(CONFIG['mid_font_size']) * len(self.lines)) / 2
+    @staticmethod
+    def rounded_rect(surface, x, y, w, h, col, r):
+        pygame.draw.circle(surface, col, (x + r, y + r), r)
+        pygame.draw.circle(surface, col, (w + x - r, y + r), r)
+        pygame.draw.circle(surface, col, (x + r, h + y - r), r)
+        pygame.draw.circle(surface, col, (w + x - r, h + y - r), r)
+        pygame.draw.rect(surface, col, (x, y + r, w, h - r * 2))
+        pygame.draw.rect(surface, col, (x + r, y, w - r * 2, r))
+        pygame.draw.rect(surface, col, (x + r, y + h - r, w - r * 2, r))
+
+    def draw(self, surface):
+        """Draw the box and its message"""
+        size = surface.get_size()
+        surface.fill((0, 0, 0, 0))
+
+        self.rounded_rect(surface, 20, 20, size[0] - 40, size[1] - 40, CONFIG.bg_colour, 10)
+        self.rounded_rect(surface, 22, 22, size[0] - 44, size[1] - 44, CONFIG.bg_darker, 8)
+        self.rounded_rect(surface, 24, 24, size[0] - 48, size[1] - 48, CONFIG.bg_colour, 6)
+
+        y = (size[1] - FONT.get_height(CONFIG.mid_font_size) * len(self.lines)) / 2
         for font_size, line in self.lines:
-            text = FONT.render(line, CONFIG['fg_colour'], font_size)
-            self.surface.blit(text, ((size[0] - text.get_width()) / 2, y))
+            text = FONT.render(line, CONFIG.fg_colour, font_size)
+            surface.blit(text, ((size[0] - text.get_width()) / 2, y))
             y += FONT.get_height(font_size)
 
+    def render(self):
+        self.surface.fill((0, 0, 0, 0))
+        self.surface.blit(self.static_layer(self.message, self.draw), (0, 0))
+
     def event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             self.destroy()
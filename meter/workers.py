@@ -0,0 +1,290 @@
+"""
+An optional backend which runs the DSP in worker processes.
+
+Threads in a single process can't filter in parallel because of the GIL, so
+with this backend the GUI process only captures audio and renders. Chunks are
+passed to the workers, and levels passed back, through ring buffers in shared
+memory so nothing is pickled on the hot path. The capture time of each chunk
+travels alongside it, so latency can be measured as in the thread backend.
+"""
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .buffers import RingBuffer
+from . import dsp
+
+# Indices into the control array shared with every worker
+AW, SPLIT, STOP = range(3)
+
+
+class SharedRingBuffer(RingBuffer):
+    """
+    A `RingBuffer` whose samples and counters live in shared memory, so the
+    producer and consumer can be in different processes. Pass `name` to
+    attach to a buffer created by another process.
+    """
+
+    def __init__(self, capacity, dtype=np.int16, name=None):
+        # The storage is set up here rather than by `RingBuffer.__init__`
+        self.capacity = capacity
+        dtype = np.dtype(dtype)
+
+        self._shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                               size=24 + capacity * dtype.itemsize)
+
+        # Written, read and dropped counts, followed by the samples
+        self._counters = np.ndarray(3, dtype=np.int64, buffer=self._shm.buf)
+        self._data = np.ndarray(capacity, dtype=dtype, buffer=self._shm.buf, offset=24)
+        if name is None:
+            self._counters[:] = 0
+
+    @property
+    def spec(self):
+        """Everything another process needs to attach to this buffer"""
+        return self.capacity, self._data.dtype.str, self._shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        capacity, dtype, name = spec
+        return cls(capacity, dtype, name)
+
+    @property
+    def _written(self):
+        return int(self._counters[0])
+
+    @_written.setter
+    def _written(self, value):
+        self._counters[0] = value
+
+    @property
+    def _read(self):
+        return int(self._counters[1])
+
+    @_read.setter
+    def _read(self, value):
+        self._counters[1] = value
+
+    @property
+    def dropped(self):
+        return int(self._counters[2])
+
+    @dropped.setter
+    def dropped(self, value):
+        self._counters[2] = value
+
+    def close(self, unlink=False):
+        # The views must go before the memory can be closed
+        del self._counters, self._data
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def work(audio_spec, stamp_spec, result_spec, control, ready, rate, chunk, channels, lo, hi, split_frequency,
+         average='min', leq_window=60, band_fft_size=4096, hop=None, window=None, true_peak=True):
+    """
+    The main loop of a worker process. Reads chunks from `audio_spec` and
+    their capture times from `stamp_spec`, filters and measures channels `lo`
+    to `hi` and writes one record per `hop` frames to `result_spec`. A record
+    is the capture time and split flag followed by the levels, their
+    time-weighted averages (NaN unless `average` asks for one), the sample
+    peaks and the true peaks, all padded out to a fixed width. `ready` is set
+    once the worker is running and its filters have been designed.
+    """
+    audio = SharedRingBuffer.attach(audio_spec)
+    stamps = SharedRingBuffer.attach(stamp_spec)
+    results = SharedRingBuffer.attach(result_spec)
+    width = record_width(lo, hi)
+    levels = (width - 2) // 4
+
+    filters = dsp.FilterChain(rate)
+    bands = dsp.BandAnalyser(rate, band_fft_size, dsp.split_bands(rate, split_frequency))
+    averager = dsp.Averager(average, rate, leq_window) if average != 'min' else None
+    hop = hop or chunk
+    hopper = dsp.Hopper(hop, window)
+    peaks = dsp.PeakDetector(hop, dsp.OVERSAMPLING if true_peak else 1)
+    samples = chunk * channels
+    poll = chunk / rate / 4
+    modes = None
+
+    dsp.prepare(rate)
+    ready.set()
+
+    while not control[STOP]:
+        if audio.available < samples or not stamps.available:
+            time.sleep(poll)
+            continue
+
+        # Filter state from another mode would only cause a transient
+        if modes != (control[AW], control[SPLIT]):
+            modes = (control[AW], control[SPLIT])
+            filters.reset()
+            hopper.reset()
+            peaks.reset()
+            bands.reset()
+            if averager is not None:
+                averager.reset()
+
+        frames = dsp.deinterleave(audio.read(samples), channels)[:, lo:hi]
+        sample_peaks, true_peaks = np.moveaxis(dsp.peak_to_db(peaks.apply(0, frames)), 2, 0)
+        if modes[0]:
+            frames = filters.apply('a', 0, frames)
+        frames, power, late = hopper.apply(0, frames)
+        captured = stamps.read(1)[0]
+        if not len(late):
+            continue
+
+        records = np.full((len(late), width), dsp.FLOOR, dtype=np.float64)
+        records[:, 0] = captured - late / rate
+        records[:, 1] = modes[1]
+        records[:, 2 + levels:2 + 2 * levels] = np.nan
+
+        if modes[1]:
+            # Split mode only uses a single channel. The high band comes first.
+            power = bands.apply(0, frames[:, :1], hop)[:, 0, ::-1]
+            records[:, 2:4] = dsp.power_to_db(power)
+            if averager is not None:
+                records[:, 2 + levels:4 + levels] = averager.apply_power('split', power, hop)
+            # Both bands show the peaks of the whole signal
+            records[:, 2 + 2 * levels:4 + 2 * levels] = sample_peaks[:, :1]
+            records[:, 2 + 3 * levels:4 + 3 * levels] = true_peaks[:, :1]
+        else:
+            count = hi - lo
+            records[:, 2:2 + count] = dsp.power_to_db(power)
+            if averager is not None:
+                records[:, 2 + levels:2 + levels + count] = averager.apply('all', frames, hop)
+            records[:, 2 + 2 * levels:2 + 2 * levels + count] = sample_peaks
+            records[:, 2 + 3 * levels:2 + 3 * levels + count] = true_peaks
+        results.write(records.ravel())
+
+    audio.close()
+    stamps.close()
+    results.close()
+
+
+def record_width(lo, hi):
+    """Records always have room for the two levels produced in split mode"""
+    return 2 + 4 * max(2, hi - lo)
+
+
+class DSPPool:
+    """
+    Runs the DSP for every stream in worker processes. A stream's channels are
+    shared between up to `workers` processes. A pump thread copies each chunk
+    from the source into the shared buffer of every worker for that stream,
+    which is the only audio work left in this process.
+    """
+
+    def __init__(self, sources, rate, chunk, channels, workers=1, split_frequency=125, buffer_chunks=16,
+                 average='min', leq_window=60, band_fft_size=4096, hop=None, window=None, true_peak=True):
+        context = multiprocessing.get_context('spawn')
+        self.control = context.Array('b', 3, lock=False)
+        self.running = True
+
+        self._poll = chunk / rate / 4
+        self._streams = []
+        self._threads = []
+        self._ready = []
+
+        for source in sources:
+            group = []
+            for channel_group in np.array_split(np.arange(channels), min(workers, channels)):
+                lo, hi = int(channel_group[0]), int(channel_group[-1]) + 1
+                audio = SharedRingBuffer(chunk * channels * buffer_chunks)
+                stamps = SharedRingBuffer(buffer_chunks, np.float64)
+                # There can be several records for every chunk
+                records = buffer_chunks * 4 * -(-chunk // (hop or chunk))
+                results = SharedRingBuffer(record_width(lo, hi) * records, np.float64)
+
+                ready = context.Event()
+                process = context.Process(target=work, daemon=True, args=(
+                    audio.spec, stamps.spec, results.spec, self.control, ready, rate, chunk, channels, lo, hi,
+                    split_frequency, average, leq_window, band_fft_size, hop, window, true_peak))
+                process.start()
+                group.append((lo, hi, audio, stamps, results, process))
+                self._ready.append(ready)
+            self._streams.append(group)
+
+            thread = threading.Thread(target=self._pump, args=(source, [g[2:4] for g in group]))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _pump(self, source, rings):
+        # Starting a worker takes a while, and anything captured before then
+        # would only overflow its buffer.
+        self.wait_ready()
+
+        while self.running:
+            for data in source.read():
+                captured = source.stamps.popleft()
+                for audio, stamps in rings:
+                    dropped = audio.dropped
+                    audio.write(data)
+                    if audio.dropped == dropped:
+                        stamps.write([captured])
+
+    def wait_ready(self):
+        """Wait until every worker has started."""
+        for ready in self._ready:
+            ready.wait()
+
+    def set_modes(self, a_weighting, split):
+        self.control[AW] = bool(a_weighting)
+        self.control[SPLIT] = bool(split)
+
+    @property
+    def dropped(self):
+        """The number of samples lost because a worker fell behind."""
+        return sum(g[2].dropped for group in self._streams for g in group)
+
+    def read(self, stream):
+        """
+        Return every result waiting for a stream as `(lo, captured, split,
+        levels, averages, peaks, true_peaks)` tuples, waiting briefly if there
+        are none. `averages` is `None` unless a time-weighted average is being
+        used.
+        """
+        out = []
+        for lo, hi, _, _, results, _ in self._streams[stream]:
+            width = record_width(lo, hi)
+            count = results.available // width
+            if count:
+                records = results.read(count * width).reshape(count, width)
+                levels = (width - 2) // 4
+                for record in records:
+                    split = bool(record[1])
+                    count = 2 if split else hi - lo
+                    averages = record[2 + levels:2 + levels + count]
+                    out.append((lo, record[0], split, record[2:2 + count],
+                                None if np.isnan(averages[0]) else averages,
+                                record[2 + 2 * levels:2 + 2 * levels + count],
+                                record[2 + 3 * levels:2 + 3 * levels + count]))
+
+        if not out:
+            time.sleep(self._poll)
+        return out
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory. Anything calling
+        `read` must have stopped first, as the result buffers are unlinked.
+        """
+        self.running = False
+        self.control[STOP] = 1
+        for group in self._streams:
+            for *_, process in group:
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+        for thread in self._threads:
+            thread.join(1)
+        for group in self._streams:
+            for _, _, audio, stamps, results, _ in group:
+                audio.close(unlink=True)
+                stamps.close(unlink=True)
+                results.close(unlink=True)
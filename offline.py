@@ -0,0 +1,5 @@
+import meter.offline
+
+
+if __name__ == '__main__':
+    meter.offline.main()
@@ -0,0 +1,164 @@
+"""
+Checks the vectorised DSP against plain, sample-by-sample versions of the
+same calculations. Blocks are fed in at random sizes, so the state carried
+from one call to the next is checked too.
+"""
+import math
+
+import numpy as np
+import pytest
+import scipy.signal
+
+from meter import dsp
+
+RATE = 48000
+
+
+def noise(frames, channels=1, level=0.3, seed=0):
+    """Random int16 frames, `level` of full scale"""
+    rng = np.random.default_rng(seed)
+    return np.round(rng.uniform(-level, level, (frames, channels)) * dsp.FULL_SCALE).astype(np.int16)
+
+
+def blocks(samples, seed=0, largest=3000):
+    """Cut a stream into blocks of random sizes, including empty ones"""
+    rng = np.random.default_rng(seed)
+    start = 0
+    while start < len(samples):
+        size = int(rng.integers(0, largest))
+        yield samples[start:start + size]
+        start += size
+
+
+@pytest.mark.parametrize('hop, window', [(1024, None), (300, None), (256, 1024), (1000, 480), (7, 20)])
+def test_hopper_matches_naive_framing(hop, window):
+    samples = noise(20000, 3)
+    hopper = dsp.Hopper(hop, window)
+    window = window or hop
+
+    frames, power, ends = [], [], []
+    fed = 0
+    for block in blocks(samples):
+        hop_frames, hop_power, late = hopper.apply('key', block)
+        fed += len(block)
+        frames.append(hop_frames)
+        power.append(hop_power)
+        ends.extend(fed - late)
+    frames, power = np.concatenate(frames), np.concatenate(power)
+
+    count = len(samples) // hop
+    assert ends == [hop * (n + 1) for n in range(count)]
+    np.testing.assert_array_equal(frames, samples[:count * hop])
+
+    # The window ending with each hop, with silence before the stream starts
+    padded = np.concatenate((np.zeros((window, 3)), samples / dsp.FULL_SCALE))
+    expected = [np.mean(padded[end:end + window] ** 2, axis=0) for end in ends]
+    np.testing.assert_allclose(power, expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize('factor', [1, dsp.OVERSAMPLING])
+@pytest.mark.parametrize('hop', [1024, 300, 1])
+def test_peak_detector_sample_peaks(factor, hop):
+    samples = noise(12000, 2, level=1)
+    samples[5000] = -dsp.FULL_SCALE
+    detector = dsp.PeakDetector(hop, factor)
+    peaks = np.concatenate([detector.apply('key', block) for block in blocks(samples)])
+
+    # When oversampling, the peaks lag by half the filter
+    lag = dsp.PEAK_TAPS // 2 if factor > 1 else 0
+    padded = np.concatenate((np.zeros((lag, 2)), np.abs(samples.astype(float))))
+    expected = [padded[start:start + hop].max(axis=0) for start in range(0, len(samples) // hop * hop, hop)]
+    np.testing.assert_allclose(peaks[:, :, 0] * dsp.FULL_SCALE, expected, rtol=1e-6, atol=1e-6)
+    assert np.all(peaks[:, :, 1] >= peaks[:, :, 0])
+    if factor == 1:
+        np.testing.assert_array_equal(peaks[:, :, 1], peaks[:, :, 0])
+
+
+@pytest.mark.parametrize('frequency', [997, 5000, 9000, 12000])
+@pytest.mark.parametrize('phase', [0, 0.7, math.pi / 4])
+def test_peak_detector_true_peak_matches_resampling(frequency, phase):
+    # Up to a quarter of the rate, where the short filter is still accurate
+    t = np.arange(9600)
+    samples = np.round(np.sin(2 * np.pi * frequency / RATE * t + phase) * 16000)
+    detector = dsp.PeakDetector(480)
+    peaks = np.concatenate([detector.apply('key', block) for block in blocks(samples[:, None].astype(np.int16))])
+
+    # Away from the ends, where resampling sees the edges of the stream
+    true_peak = peaks[2:-2, 0, 1].max() * dsp.FULL_SCALE
+    expected = np.abs(scipy.signal.resample_poly(samples, dsp.OVERSAMPLING, 1))[800:-800].max()
+    assert abs(20 * math.log10(true_peak / expected)) < 0.05
+
+
+def naive_weighting(squared, alpha):
+    """The one-pole filter, a sample at a time"""
+    out = np.zeros_like(squared)
+    level = 0
+    for n, value in enumerate(squared):
+        level = alpha * level + (1 - alpha) * value
+        out[n] = level
+    return out
+
+
+@pytest.mark.parametrize('kind', ['fast', 'slow', 'impulse', 'leq'])
+def test_averager_matches_direct_formulas(kind):
+    chunk = 256
+    samples = noise(chunk * 60, 2, seed=1)
+    # A burst, so the impulse level has something to hold and decay from
+    samples[chunk * 20:chunk * 22] *= 3
+    averager = dsp.Averager(kind, RATE, window=0.05)
+
+    levels = []
+    for count in (1, 7, 0, 20, 3, 29):
+        block = samples[sum(len(level) for level in levels) * chunk:][:count * chunk]
+        levels.append(averager.apply('key', block, chunk))
+    levels = np.concatenate(levels)
+
+    squared = (samples / dsp.FULL_SCALE) ** 2
+    ends = np.arange(chunk - 1, len(samples), chunk)
+    if kind == 'leq':
+        window = round(0.05 * RATE / chunk) * chunk
+        power = [squared[max(0, end + 1 - window):end + 1].mean(axis=0) for end in ends]
+    else:
+        power = naive_weighting(squared, math.exp(-1 / (RATE * dsp.TIME_WEIGHTINGS[kind])))
+        if kind == 'impulse':
+            # held[n] = max(level[n], held[n - 1] * d)
+            decay = math.exp(-1 / (RATE * dsp.IMPULSE_DECAY))
+            held = np.zeros(2)
+            for n, level in enumerate(power):
+                held = power[n] = np.maximum(level, held * decay)
+        power = power[ends]
+
+    np.testing.assert_allclose(levels, dsp.power_to_db(np.array(power)), atol=1e-6)
+
+
+def test_band_analyser_matches_fft_band_sum():
+    # Bins are 100Hz wide, and the edges fall between bins so each is wholly in one band
+    rate, size, chunk = 25600, 256, 100
+    bands = [(0, 1050), (1050, 3050), (3050, rate / 2)]
+    analyser = dsp.BandAnalyser(rate, size, bands)
+    samples = noise(chunk * 40, 2, seed=2)
+
+    power = []
+    for count in (1, 1, 5, 0, 13, 20):
+        block = samples[sum(len(p) for p in power) * chunk:][:count * chunk]
+        power.append(analyser.apply('key', block, chunk))
+    power = np.concatenate(power)
+
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(size) / size)
+    padded = np.concatenate((np.zeros((size, 2)), samples / dsp.FULL_SCALE))
+    freqs = np.fft.rfftfreq(size, 1 / rate)
+    expected = []
+    for end in range(chunk, len(samples) + 1, chunk):
+        spectrum = np.abs(np.fft.rfft(padded[end:end + size] * window[:, None], axis=0)) ** 2
+        spectrum[1:-1] *= 2
+        spectrum /= size * np.sum(window ** 2)
+        # The top band takes the Nyquist bin too
+        edges = [(low, high + (high == rate / 2)) for low, high in bands]
+        expected.append([[spectrum[(low <= freqs) & (freqs < high), channel].sum() for low, high in edges]
+                         for channel in range(2)])
+        # The bands cover the whole spectrum, so add up to the windowed mean square
+        windowed = padded[end:end + size] * window[:, None]
+        np.testing.assert_allclose(np.sum(expected[-1], axis=1),
+                                   np.sum(windowed ** 2, axis=0) / np.sum(window ** 2), rtol=1e-9)
+
+    np.testing.assert_allclose(power, expected, rtol=1e-9, atol=1e-15)
@@ -0,0 +1,40 @@
+"""
+Checks that `GridingManager.hit_test`'s cell index finds the same panes as
+checking every child in turn.
+"""
+import numpy as np
+import pytest
+
+from meter.grid import GridingManager, Manager, Pane
+
+
+class Frame(Manager):
+    """A parent giving the grid a fixed size"""
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def request_size(self, child):
+        return self.size
+
+
+@pytest.mark.parametrize('size', [(320, 240), (317, 239), (800, 481)])
+@pytest.mark.parametrize('seed', range(5))
+def test_hit_test_matches_linear_scan(size, seed):
+    rng = np.random.default_rng(seed)
+    grid = GridingManager()
+    grid.parent = Frame(size)
+
+    columns, rows = int(rng.integers(1, 7)), int(rng.integers(1, 7))
+    for _ in range(int(rng.integers(1, 12))):
+        column, row = int(rng.integers(0, columns)), int(rng.integers(0, rows))
+        pane = Pane(col_span=int(rng.integers(1, columns - column + 1)),
+                    row_span=int(rng.integers(1, rows - row + 1)))
+        pane.visible = bool(rng.random() > 0.2)
+        grid.grid(pane, column, row)
+
+    position = (int(rng.integers(0, 50)), int(rng.integers(0, 50)))
+    for x in range(position[0] - 2, position[0] + size[0] + 2):
+        for y in range(position[1] - 2, position[1] + size[1] + 2, 3):
+            assert grid.hit_test((x, y), position) == Manager.hit_test(grid, (x, y), position)